@@ -4,13 +4,32 @@
  * See README.md
 """
 
+import time
+startTime = time.monotonic()
+
 import sys
 import os
 import logging
 from logging.handlers import RotatingFileHandler
 
-import model, server
-from threads import downloader, listfetch, sbgenerator
+# startup phases, (name, seconds)
+phases = []
+phaseTime = startTime
+
+def phase(name):
+    """
+    Record time taken since the previous phase
+    """
+    global phaseTime
+    now = time.monotonic()
+    phases.append((name, now - phaseTime))
+    phaseTime = now
+
+import model
+phase('load model and database')
+import server
+from threads import downloader, listfetch, sbgenerator, versioncheck, filewriter, logwriter
+phase('import server')
 
 # setup logger
 logger = logging.getLogger('piworkout-server')
@@ -24,20 +43,37 @@ stdout_handler = logging.StreamHandler(stream=sys.stdout)
 stdout_handler.setFormatter(formatter)
 logger.addHandler(stdout_handler)
 
-def main():   
-    # allow localhost
-    os.environ['OAUTHLIB_INSECURE_TRANSPORT'] = '1'
+def logPhases():
+    for name, seconds in phases:
+        logger.info(f'  startup {name} {seconds * 1000:.0f}ms')
+    logger.info(f'  startup total {(phaseTime - startTime) * 1000:.0f}ms')
+    phases.clear()
+
+def listening():
+    """
+    Websocket is accepting connections, start background threads
+    """
+    phase('start websocket')
 
     # threads
     downloader.run()
     listfetch.run()
     sbgenerator.run()
+    versioncheck.run()
+    filewriter.run()
+    logwriter.run()
+    phase('start threads')
+    logPhases()
+
+def main():   
+    # allow localhost
+    os.environ['OAUTHLIB_INSECURE_TRANSPORT'] = '1'
 
-    # websocket server
+    # websocket server, clients can connect before the background threads are running
     host = os.environ['BACKEND_HOST']
     port = os.environ['BACKEND_PORT']
     logger.info('Starting websocket on ' + host + ':' + port)
-    server.start()
+    server.start(listening)
 
 if __name__ == "__main__":
     try:
@@ -48,6 +84,9 @@ if __name__ == "__main__":
         downloader.close()
         listfetch.close()
         sbgenerator.close()
+        versioncheck.close()
+        filewriter.close()
+        logwriter.close()
 
         # close db
         model.close()
@@ -0,0 +1,112 @@
+"""
+ * Developed by Hutz Media Ltd. <info@hutzmedia.com>
+ * Copyright 2026-10-18
+ * See README.md
+"""
+
+# Compare wire codecs on a realistic init payload
+# usage: python benchmarks/codec_benchmark.py [videos=500] [iterations=50]
+
+import os
+import sys
+import time
+import random
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import codec
+
+def createVideo(index):
+    return {
+        'id': index + 1,
+        'order': index,
+        'videoId': ''.join(random.choice('abcdefghijklmnopqrstuvwxyzABCDEFGHIJKLMNOPQRSTUVWXYZ0123456789-_') for _ in range(11)),
+        'source': 'youtube',
+        'url': 'https://www.youtube.com/watch?v=dQw4w9WgXcQ',
+        'filename': 'Full_Body_Workout___45_Minutes_' + str(index) + '.webm',
+        'filesize': random.randint(100000000, 4000000000),
+        'title': 'Full Body Workout | 45 Minutes #' + str(index),
+        'description': ('Warm up, strength circuit and cool down. Equipment: dumbbells and a mat. ' * 20) + '\n\nhttps://example.com/program',
+        'duration': random.randint(600, 3600),
+        'position': random.random() * 600,
+        'width': 2560,
+        'height': 1440,
+        'tbr': random.randint(2000, 12000),
+        'fps': 30,
+        'vcodec': 'vp09.00.50.08',
+        'status': 5,
+        'progress': None,
+        'channelName': 'Workout Channel',
+        'channelImageUrl': 'https://yt3.ggpht.com/ytc/channel-image=s88-c-k-c0x00ffffff-no-rj',
+        'date': '2024-01-12',
+        'views': str(random.randint(1000, 10000000)),
+        'likes': str(random.randint(10, 100000)),
+        'rating': 'none',
+        'sponsorblock': {
+            'status': 200,
+            'expires_at': time.time() + 10800,
+            'segments': [{'category': 'sponsor', 'actionType': 'skip', 'segment': [18.069, 78.36], 'UUID': 'a' * 64, 'videoDuration': 2700.241, 'locked': 0, 'votes': 0, 'description': ''}],
+        },
+        'playlistItemId': 'UEx' + 'x' * 40,
+    }
+
+def createInit(count):
+    return {
+        'namespace': 'init',
+        'data': {
+            'settings': {
+                'audioDelay': '150',
+                'networkDelay': '20',
+                'videoQuality': '1440p',
+                'playlistUrl': 'https://www.youtube.com/playlist?list=PL' + 'x' * 32,
+                'youtubeCookie': '# Netscape HTTP Cookie File\n' + ('.youtube.com\tTRUE\t/\tTRUE\t1700000000\tNAME\tVALUE\n' * 30),
+                'googleAPIKey': '',
+                'ytMarkWatchedHost': '',
+                'ytDlpArgv': '',
+            },
+            'connected': True,
+            'videos': [createVideo(i) for i in range(count)],
+            'videosVersion': 12,
+            'player': {'time': 120.5, 'videoId': 3, 'status': 3, 'client': 'web', 'action': 'progress'},
+            'routines': [{'id': i, 'order': i, 'name': 'Routine ' + str(i), 'description': 'Routine', 'exercises': [{'id': j, 'routineId': i, 'order': j, 'name': 'Exercise', 'tooltip': 'Tooltip', 'image': '', 'description': 'Description', 'video_url': ''} for j in range(10)]} for i in range(20)],
+            'versions': {'piworkoutServer': '1.0.0', 'ytDlp': '2024.01.01 (latest=2024.01.01)'},
+        },
+        'messageId': 1,
+    }
+
+def measure(fn, iterations):
+    best = None
+    for i in range(iterations):
+        start = time.perf_counter()
+        fn()
+        elapsed = time.perf_counter() - start
+        if (best == None or elapsed < best):
+            best = elapsed
+    return best
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 500
+    iterations = int(sys.argv[2]) if len(sys.argv) > 2 else 50
+    random.seed(1)
+    obj = createInit(count)
+
+    codecs = [('json (stdlib)', codec.JsonCodec())]
+    if (codec.orjson != None):
+        codecs.append(('json (orjson)', codec.FastJsonCodec()))
+    else:
+        print('orjson not installed, skipping')
+    if (codec.msgpack != None):
+        codecs.append(('msgpack', codec.MsgpackCodec()))
+    else:
+        print('msgpack not installed, skipping')
+
+    print(f'init payload with {count} videos, best of {iterations}')
+    print(f'{"codec":<16}{"encode ms":>12}{"decode ms":>12}{"bytes":>12}')
+    for name, c in codecs:
+        message = c.encode(obj)
+        size = len(message.encode('utf-8')) if isinstance(message, str) else len(message)
+        encode = measure(lambda: c.encode(obj), iterations)
+        decode = measure(lambda: c.decode(message), iterations)
+        print(f'{name:<16}{encode * 1000:>12.2f}{decode * 1000:>12.2f}{size:>12}')
+
+if __name__ == "__main__":
+    main()
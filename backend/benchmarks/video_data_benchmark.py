@@ -0,0 +1,178 @@
+"""
+ * Developed by Hutz Media Ltd. <info@hutzmedia.com>
+ * Copyright 2026-10-18
+ * See README.md
+"""
+
+# Measure videos.data(), Video construction and field assignment on a synthetic library,
+# compared with the previous Video.toObject() and a plain Video dataclass
+# usage: python benchmarks/video_data_benchmark.py [videos=2000] [iterations=50]
+# runs against a temporary database, the app database is not touched
+
+import os
+import sys
+import time
+import random
+import tempfile
+from dataclasses import dataclass, make_dataclass, field, fields
+
+backend = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, backend)
+os.chdir(tempfile.mkdtemp())
+os.mkdir('db')
+
+import model
+from namespaces import videos
+
+def videoFields(index):
+    return dict(
+        id=index + 1,
+        order=index,
+        videoId=''.join(random.choice('abcdefghijklmnopqrstuvwxyzABCDEFGHIJKLMNOPQRSTUVWXYZ0123456789-_') for _ in range(11)),
+        source='youtube',
+        url='https://www.youtube.com/watch?v=dQw4w9WgXcQ',
+        filename='Full_Body_Workout___45_Minutes_' + str(index) + '.webm',
+        filesize=random.randint(100000000, 4000000000),
+        title='Full Body Workout | 45 Minutes #' + str(index),
+        description=('Warm up, strength circuit and cool down. Equipment: dumbbells and a mat. ' * 20),
+        duration=random.randint(600, 3600),
+        position=random.random() * 600,
+        width=2560,
+        height=1440,
+        tbr=random.randint(2000, 12000),
+        fps=30,
+        vcodec='vp09.00.50.08',
+        status=model.STATUS_COMPLETE,
+        watchedUrl='',
+        progress=None,
+        channelName='Workout Channel',
+        channelImageUrl='',
+        date='2024-01-12',
+        views=random.randint(1000, 10000000),
+        likes=random.randint(10, 100000),
+        rating='none',
+        sponsorblock=None,
+        playlistItemId='',
+    )
+
+def createVideo(index):
+    return model.Video(**videoFields(index))
+
+# Video before it was slotted and cached its encoded fields
+LegacyVideo = make_dataclass('LegacyVideo', [(item.name, item.type, field(default=item.default)) for item in fields(model.Video) if not item.name.startswith('_')])
+
+def legacyToObject(self):
+    """
+    Video.toObject() before fields were cached
+    """
+    if (self.progress):
+        pObj = self.progress.toObject()
+    else:
+        pObj = None
+    return {
+        'id': int(self.id),
+        'order': int(self.order),
+        'videoId': str(self.videoId),
+        'source': str(self.source),
+        'url': str(self.url),
+        'filename': str(self.filename),
+        'filesize': int(self.filesize or 0),
+        'title': str(self.title),
+        'description': str(self.description),
+        'duration': int(self.duration),
+        'position': float(self.position),
+        'width': int(self.width),
+        'height': int(self.height),
+        'tbr': int(self.tbr),
+        'fps': int(self.fps),
+        'vcodec': str(self.vcodec),
+        'status': int(self.status),
+        'progress': pObj,
+        'channelName': self.channelName,
+        'channelImageUrl': self.channelImageUrl,
+        'date': self.date,
+        'views': self.views,
+        'likes': self.likes,
+        'rating': self.rating,
+        'sponsorblock': self.sponsorblock,
+        'playlistItemId': self.playlistItemId,
+    }
+
+def legacyData():
+    res = []
+    with model.video.dataMutex():
+        for item in model.video.data(False, False):
+            res.append(legacyToObject(item))
+    return res
+
+def measure(fn, iterations, before = None):
+    best = None
+    for i in range(iterations):
+        if (before != None):
+            before()
+        start = time.perf_counter()
+        fn()
+        elapsed = time.perf_counter() - start
+        if (best == None or elapsed < best):
+            best = elapsed
+    return best
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    iterations = int(sys.argv[2]) if len(sys.argv) > 2 else 50
+    random.seed(1)
+    items = [createVideo(i) for i in range(count)]
+    model.video.setItems(items)
+    downloading = items[0]
+    downloading.progress = model.VideoProgress(totalBytes=1000000)
+
+    if (videos.data() != legacyData()):
+        print('videos.data() does not match the previous Video.toObject()')
+        return None
+
+    def progress():
+        # downloader progress hook, the progress object changes in place
+        downloading.progress.downloadedBytes += 1000
+
+    def positions():
+        # every video moves, e.g. a reorder
+        for item in items:
+            item.order = item.order + 1
+
+    print(f'videos.data() with {count} videos, best of {iterations}')
+    print(f'{"case":<32}{"before ms":>12}{"after ms":>12}')
+    cases = [
+        ('unchanged', None),
+        ('download progress', progress),
+        ('all videos reordered', positions),
+    ]
+    for name, before in cases:
+        legacy = measure(legacyData, iterations, before)
+        cached = measure(videos.data, iterations, before)
+        print(f'{name:<32}{legacy * 1000:>12.2f}{cached * 1000:>12.2f}')
+
+    rows = [videoFields(i) for i in range(count)]
+    legacyItems = [LegacyVideo(**row) for row in rows]
+
+    def assign(videos):
+        # e.g. position saves and status changes, the cached video marks the field
+        def fn():
+            for item in videos:
+                item.position = 1.5
+                item.status = model.STATUS_COMPLETE
+        return fn
+
+    print(f'\nVideo with {count} videos, best of {iterations}')
+    print(f'{"case":<32}{"before ms":>12}{"after ms":>12}')
+    cases = [
+        ('construction', lambda: [LegacyVideo(**row) for row in rows], lambda: [model.Video(**row) for row in rows]),
+        ('assignment of 2 fields', assign(legacyItems), assign(items)),
+    ]
+    for name, legacy, current in cases:
+        before = measure(legacy, iterations)
+        after = measure(current, iterations)
+        print(f'{name:<32}{before * 1000:>12.2f}{after * 1000:>12.2f}')
+    model.close()
+
+if __name__ == "__main__":
+    main()
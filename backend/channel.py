@@ -0,0 +1,199 @@
+"""
+ * Developed by Hutz Media Ltd. <info@hutzmedia.com>
+ * Copyright 2026-10-18
+ * See README.md
+"""
+
+import asyncio
+import os
+import threading
+import itertools
+from collections import deque
+
+import logging
+logger = logging.getLogger('piworkout-server')
+
+# per client limits for unsent messages
+MAX_MESSAGES = int(os.getenv('CLIENT_QUEUE_MAX_MESSAGES', '2000'))
+MAX_BYTES = int(os.getenv('CLIENT_QUEUE_MAX_BYTES', str(16 * 1024 * 1024)))
+# what to do when a client is over its limits
+#   drop: drop oldest non-critical messages (coalesced progress), resync if that is not enough
+#   resync: discard unsent messages and send a fresh init snapshot
+#   disconnect: close the connection, the client reconnects and receives init
+POLICY = os.getenv('CLIENT_QUEUE_POLICY', 'drop')
+
+# number of times each policy has fired (all clients)
+COUNTERS = {
+    'drop': 0,
+    'resync': 0,
+    'disconnect': 0,
+}
+
+_ids = itertools.count(1)
+
+# returned by Channel.get()
+RESYNC = object() # producer should send a fresh init snapshot
+DISCONNECT = object() # producer should close the connection
+
+class _Slot:
+    """
+    Latest value slot. Newer messages with the same key replace its message and move it to the end of the channel.
+    """
+    __slots__ = ('key', 'message')
+
+    def __init__(self, key, message):
+        self.key = key
+        self.message = message
+
+class Deferred:
+    """
+    Message encoded by the producer right before it is written to the socket, prepare(obj) is called first.
+    Used for values that must be taken at send time, e.g. the transmit time of a ping reply.
+    """
+    __slots__ = ('obj', 'codec', 'prepare', 'size')
+
+    def __init__(self, obj, codec, prepare):
+        self.obj = obj
+        self.codec = codec
+        self.prepare = prepare
+        self.size = len(codec.encode(obj)) # for the channel limits, prepare() should not change the size much
+
+    def encode(self):
+        self.prepare(self.obj)
+        return self.codec.encode(self.obj)
+
+    def __len__(self):
+        return self.size
+
+class Channel:
+    """
+    Outbound message channel for a single websocket client.
+    put() can be called from any thread. Messages from worker threads are handed to the event loop
+    with call_soon_threadsafe so the producer wakes immediately and idle clients cost nothing.
+    Messages put with a key (e.g. download progress for a video) coalesce, only the newest message for a key is ever pending
+    and it is delivered after every message put before it.
+    Keyed messages are non-critical and are the first to be dropped when the client falls behind.
+    """
+
+    def __init__(self, loop: asyncio.AbstractEventLoop, codec):
+        self.id = next(_ids) # identifies the client in logs and metrics
+        self._loop = loop
+        self.codec = codec # wire codec negotiated during the websocket handshake
+        self._loopThreadId = threading.get_ident() # channel is created on the event loop thread
+        self._messages = deque()
+        self._slots = {} # key => pending _Slot
+        self._bytes = 0 # size of unsent messages
+        self._event = asyncio.Event()
+        self._closed = False
+        self.capabilities = set() # optional protocol features requested by the client (e.g. videosDelta)
+        self.dropped = 0 # number of messages dropped because the client fell behind
+        self.clock = None # clocksync.ClockEstimate, created when the client sends its first sync sample
+
+    def put(self, message, key = None):
+        """
+        Add message to channel (thread safe). If key is specified replace any pending message with the same key.
+        Messages are added in the order put() is called from any thread, server.py relies on this to keep messageIds in order.
+        """
+        if (threading.get_ident() == self._loopThreadId):
+            # queued behind messages already handed over by other threads
+            self._loop.call_soon(self._put, message, key)
+            return
+        try:
+            self._loop.call_soon_threadsafe(self._put, message, key)
+        except RuntimeError:
+            # event loop has been closed
+            pass
+
+    def _put(self, message, key):
+        # always runs on the event loop thread
+        if (self._closed):
+            return
+        if (key == None):
+            self._messages.append(message)
+        else:
+            slot = self._slots.get(key)
+            if (slot != None):
+                # replace stale message and move it behind messages queued since, the client never sees a newer value before older state
+                self._bytes -= len(slot.message)
+                self._bytes += len(message)
+                slot.message = message
+                if (self._messages[-1] is not slot):
+                    self._messages.remove(slot)
+                    self._messages.append(slot)
+                return
+            slot = _Slot(key, message)
+            self._slots[key] = slot
+            self._messages.append(slot)
+        self._bytes += len(message)
+        if (len(self._messages) > MAX_MESSAGES or self._bytes > MAX_BYTES):
+            self._overflow()
+        self._event.set()
+
+    def _overflow(self):
+        # client is not reading fast enough
+        policy = POLICY
+        if (policy == 'drop'):
+            for item in list(self._messages):
+                if (len(self._messages) <= MAX_MESSAGES and self._bytes <= MAX_BYTES):
+                    return None
+                if (type(item) is _Slot):
+                    self._messages.remove(item)
+                    del self._slots[item.key]
+                    self._bytes -= len(item.message)
+                    COUNTERS['drop'] += 1
+                    self.dropped += 1
+            if (len(self._messages) <= MAX_MESSAGES and self._bytes <= MAX_BYTES):
+                return None
+            # only critical messages are waiting
+            policy = 'resync'
+
+        self._messages.clear()
+        self._slots.clear()
+        self._bytes = 0
+        if (policy == 'resync'):
+            logger.warning('Client is not keeping up with messages, sending snapshot.')
+            COUNTERS['resync'] += 1
+            self._messages.append(RESYNC)
+        else:
+            logger.warning('Client is not keeping up with messages, disconnecting.')
+            COUNTERS['disconnect'] += 1
+            self._closed = True
+            self._messages.append(DISCONNECT)
+
+    async def get(self):
+        """
+        Wait for the next message
+        """
+        while (not self._messages):
+            self._event.clear()
+            await self._event.wait()
+        message = self._messages.popleft()
+        if (type(message) is _Slot):
+            del self._slots[message.key]
+            message = message.message
+        elif (message is RESYNC or message is DISCONNECT):
+            return message
+        self._bytes -= len(message)
+        return message
+
+    def close(self):
+        """
+        Stop accepting messages, called when the client disconnects
+        """
+        self._closed = True
+        self._messages.clear()
+        self._slots.clear()
+        self._bytes = 0
+
+    @property
+    def closed(self):
+        return self._closed
+
+    def size(self):
+        """
+        Size of unsent messages
+        """
+        return self._bytes
+
+    def __len__(self):
+        return len(self._messages)
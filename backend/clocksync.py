@@ -0,0 +1,106 @@
+"""
+ * Developed by Hutz Media Ltd. <info@hutzmedia.com>
+ * Copyright 2026-10-18
+ * See README.md
+"""
+
+import time
+import threading
+from collections import deque
+
+import logging
+logger = logging.getLogger('piworkout-server')
+
+# NTP style clock synchronization over the ping namespace
+#   client sends   {namespace: 'ping', uuid, t0}                  t0 = client time the ping was sent
+#   server replies {namespace: 'ping', uuid, t0, t1, t2, ...}     t1 = server receive time, t2 = server send time
+#   client records t3 = client time the reply arrived
+#   offset = ((t1 - t0) + (t2 - t3)) / 2   (server time - client time)
+#   rtt    = (t3 - t0) - (t2 - t1)
+# clients send a burst of pings and pass completed samples [[t0, t1, t2, t3], ...] back in later pings
+# so the server knows each client's offset too. All times are milliseconds.
+
+SAMPLES = 16 # samples kept per client
+MIN_SAMPLES = 3 # samples needed before an estimate is reported
+RTT_TOLERANCE = 1.5 # samples with rtt above minimum rtt * RTT_TOLERANCE + RTT_SLACK are rejected as outliers
+RTT_SLACK = 2.0
+
+_start = time.monotonic()
+
+def now():
+    """
+    Server clock in milliseconds. Monotonic, unaffected by changes to the system clock.
+    """
+    return (time.monotonic() - _start) * 1000
+
+class ClockEstimate:
+    """
+    Offset and round trip time of a single client's clock
+    """
+
+    def __init__(self):
+        self._samples = deque(maxlen=SAMPLES) # (offset, rtt)
+        self._lastT0 = None # newest sample added, clients send their recent samples with every ping
+        self._mutex = threading.Lock()
+        self.offset = None # server time - client time, None until enough samples
+        self.rtt = None
+
+    def add(self, t0: float, t1: float, t2: float, t3: float):
+        """
+        Add completed ping sample. Returns False if the sample is not valid or not newer than the last sample added.
+        """
+        rtt = (t3 - t0) - (t2 - t1)
+        if (rtt < 0):
+            return False
+        offset = ((t1 - t0) + (t2 - t3)) / 2
+        with self._mutex:
+            if (self._lastT0 != None and t0 <= self._lastT0):
+                # already added (t0 is the client's send time, unique per ping)
+                return False
+            self._lastT0 = t0
+            self._samples.append((offset, rtt))
+            self._estimate()
+        return True
+
+    def _estimate(self):
+        if (len(self._samples) < MIN_SAMPLES):
+            return None
+        # samples delayed in one direction (wifi retries, busy event loop) have a large rtt and a skewed offset
+        minRtt = min(rtt for offset, rtt in self._samples)
+        limit = minRtt * RTT_TOLERANCE + RTT_SLACK
+        accepted = sorted((offset, rtt) for offset, rtt in self._samples if rtt <= limit)
+        # median of the remaining offsets
+        middle = len(accepted) // 2
+        if (len(accepted) % 2 == 1):
+            self.offset = accepted[middle][0]
+        else:
+            self.offset = (accepted[middle - 1][0] + accepted[middle][0]) / 2
+        self.rtt = sum(rtt for offset, rtt in accepted) / len(accepted)
+
+    def toServerTime(self, clientTime: float):
+        if (self.offset == None):
+            return None
+        return clientTime + self.offset
+
+    def toClientTime(self, serverTime: float):
+        if (self.offset == None):
+            return None
+        return serverTime - self.offset
+
+def estimate(queue):
+    """
+    Clock estimate for a client, created on first use
+    """
+    if (queue.clock == None):
+        queue.clock = ClockEstimate()
+    return queue.clock
+
+def maxRtt(clients):
+    """
+    Largest round trip time of the clients that have an estimate
+    """
+    result = 0.0
+    for queue in clients:
+        if (queue.clock != None and queue.clock.rtt != None and queue.clock.rtt > result):
+            result = queue.clock.rtt
+    return result
@@ -0,0 +1,110 @@
+"""
+ * Developed by Hutz Media Ltd. <info@hutzmedia.com>
+ * Copyright 2026-10-18
+ * See README.md
+"""
+
+import json
+from collections import namedtuple
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+import logging
+logger = logging.getLogger('piworkout-server')
+
+class JsonCodec:
+    """
+    Standard library json, text frames
+    """
+    name = 'json'
+    binary = False
+
+    def encode(self, obj):
+        return json.dumps(obj)
+
+    def decode(self, message):
+        return json.loads(message)
+
+class FastJsonCodec(JsonCodec):
+    """
+    orjson encoder, same wire format as JsonCodec
+    """
+
+    def encode(self, obj):
+        try:
+            return orjson.dumps(obj).decode('utf-8')
+        except TypeError:
+            # e.g. integers larger than 64 bits
+            return json.dumps(obj)
+
+    def decode(self, message):
+        return orjson.loads(message)
+
+class MsgpackCodec:
+    """
+    MessagePack, binary frames
+    """
+    name = 'msgpack'
+    binary = True
+
+    def encode(self, obj):
+        return msgpack.packb(obj, use_bin_type=True)
+
+    def decode(self, message):
+        return msgpack.unpackb(message, raw=False)
+
+JSON = FastJsonCodec() if orjson != None else JsonCodec()
+MSGPACK = MsgpackCodec() if msgpack != None else None
+
+# websocket subprotocols the client can request with new WebSocket(url, ['piworkout.msgpack', 'piworkout.json'])
+# clients that do not request a subprotocol use json
+SUBPROTOCOLS = {
+    'piworkout.json': JSON,
+}
+if (MSGPACK != None):
+    SUBPROTOCOLS['piworkout.msgpack'] = MSGPACK
+
+def negotiate(subprotocol):
+    """
+    Get codec for the subprotocol selected during the websocket handshake
+    """
+    return SUBPROTOCOLS.get(subprotocol, JSON)
+
+# binary messages from clients (file uploads, exercise images)
+#   8 bytes magic number
+#   8 bytes (string) version
+#   28 bytes (string) namespace
+#   36 bytes (string) uuid
+#   8 bytes (string) action
+#   n bytes namespace specific
+MAGIC_NUMBER = b'\x89webSOK\n'
+BinaryHeader = namedtuple('BinaryHeader', ['version', 'namespace', 'uuid', 'action'])
+
+def isBinaryMessage(message):
+    """
+    Determine if message is a binary namespace message rather than an encoded object
+    """
+    return message[0:8] == MAGIC_NUMBER
+
+def parseBinaryHeader(message):
+    """
+    Parse header of binary message. Returns None if the magic number does not match.
+    """
+    if (not isBinaryMessage(message)):
+        return None
+    def string(start, end):
+        return bytes(message[start:end]).decode('ascii', 'replace').rstrip('\x00')
+    return BinaryHeader(
+        version=string(8, 16),
+        namespace=string(16, 44),
+        uuid=string(44, 80),
+        action=string(80, 88),
+    )
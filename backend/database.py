@@ -0,0 +1,322 @@
+"""
+ * Developed by Hutz Media Ltd. <info@hutzmedia.com>
+ * Copyright 2026-10-18
+ * See README.md
+"""
+
+import sqlite3
+import threading
+import time
+import re
+import os
+import weakref
+from contextlib import contextmanager
+
+import metrics
+
+import logging
+logger = logging.getLogger('piworkout-server')
+
+# sqlite connection manager
+#   one writer connection, writes are serialized by writeMutex and committed when the write() block ends
+#   one reader connection per thread, in WAL mode readers see the last commit and never wait for the writer
+PATH = './db/database.sqlite3'
+SYNCHRONOUS = os.getenv('SQLITE_SYNCHRONOUS', 'NORMAL') # NORMAL only syncs the WAL at checkpoints, commits stay durable against app crashes
+MMAP_SIZE = int(os.getenv('SQLITE_MMAP_SIZE', str(64 * 1024 * 1024))) # bytes
+CACHE_SIZE = int(os.getenv('SQLITE_CACHE_SIZE', str(8 * 1024))) # KiB per connection
+BUSY_TIMEOUT = 5000 # ms to wait for a lock held by another process (e.g. the sqlite3 shell)
+SLOW_STATEMENT = float(os.getenv('SQLITE_SLOW_STATEMENT', '0.2')) # seconds, slower statements are logged
+VACUUM_CHUNK = 1024 # pages freed per incremental vacuum step, writers wait at most one step
+FLUSH_INTERVAL = float(os.getenv('SQLITE_FLUSH_INTERVAL', '0.5')) # seconds write behind rows wait before they are committed
+
+_statementNames = {}
+_tableRe = re.compile(r'\b(?:FROM|INTO|UPDATE|TABLE(?: IF (?:NOT )?EXISTS)?)\s+`?(\w+)', re.IGNORECASE)
+
+def dict_factory(cursor, row):
+    d = {}
+    for idx, col in enumerate(cursor.description):
+        d[col[0]] = row[idx]
+    return d
+
+def statementName(sql: str):
+    """
+    Metric label for a statement, e.g. 'SELECT videos'. Statements are static strings so the labels are bounded.
+    """
+    name = _statementNames.get(sql)
+    if (name == None):
+        words = sql.split(None, 1)
+        name = words[0].upper() if (len(words) > 0) else ''
+        match = _tableRe.search(sql)
+        if (match != None):
+            name += ' ' + match.group(1)
+        _statementNames[sql] = name
+    return name
+
+def _observe(sql: str, seconds: float, writer: bool):
+    name = statementName(sql)
+    connection = 'writer' if (writer) else 'reader'
+    metrics.inc('piworkout_sqlite_statements_total', 1, statement=name, connection=connection)
+    metrics.inc('piworkout_sqlite_statement_seconds_total', seconds, statement=name, connection=connection)
+    if (seconds > SLOW_STATEMENT):
+        logger.warning('Slow sqlite statement ' + name + ' (' + connection + ') ' + str(round(seconds * 1000)) + 'ms')
+
+class Cursor:
+    """
+    sqlite3.Cursor that records how long each statement takes
+    """
+
+    def __init__(self, cursor, writer: bool):
+        self._cursor = cursor
+        self._writer = writer
+
+    def execute(self, sql: str, parameters = ()):
+        start = time.perf_counter()
+        try:
+            self._cursor.execute(sql, parameters)
+        finally:
+            _observe(sql, time.perf_counter() - start, self._writer)
+        return self
+
+    def executemany(self, sql: str, parameters):
+        start = time.perf_counter()
+        try:
+            self._cursor.executemany(sql, parameters)
+        finally:
+            _observe(sql, time.perf_counter() - start, self._writer)
+        return self
+
+    def fetchone(self):
+        return self._cursor.fetchone()
+
+    def fetchall(self):
+        return self._cursor.fetchall()
+
+    def __iter__(self):
+        return iter(self._cursor)
+
+    @property
+    def lastrowid(self):
+        return self._cursor.lastrowid
+
+    @property
+    def rowcount(self):
+        return self._cursor.rowcount
+
+    @property
+    def description(self):
+        return self._cursor.description
+
+class Connection(sqlite3.Connection):
+    """
+    sqlite3.Connection that can be weakly referenced, reader connections close when their thread ends
+    """
+
+class Database:
+    def __init__(self, path: str = PATH):
+        self.path = path
+        self.writeMutex = metrics.TimedLock('sqlite') # serializes writes, records time spent waiting for the writer
+        self.commits = 0
+        self.commitSeconds = 0.0
+        self._local = threading.local()
+        self._readers = weakref.WeakSet() # open reader connections, closed with the database
+        self._readersMutex = threading.Lock()
+        self._closed = False
+
+        self._writer = self._connect()
+        mode = self._writer.execute('PRAGMA journal_mode=WAL').fetchone()['journal_mode']
+        if (mode.lower() != 'wal'):
+            logger.warning('sqlite journal mode is ' + mode + ', readers will wait for writes')
+
+    def _connect(self, readOnly: bool = False):
+        # connections are used by one thread at a time, check_same_thread=False lets close() run on the main thread
+        connection = sqlite3.connect(self.path, check_same_thread=False, timeout=BUSY_TIMEOUT / 1000, factory=Connection)
+        connection.row_factory = dict_factory
+        connection.execute('PRAGMA synchronous=' + SYNCHRONOUS)
+        connection.execute('PRAGMA mmap_size=' + str(MMAP_SIZE))
+        connection.execute('PRAGMA cache_size=' + str(-CACHE_SIZE))
+        connection.execute('PRAGMA temp_store=MEMORY')
+        connection.execute('PRAGMA busy_timeout=' + str(BUSY_TIMEOUT))
+        if (readOnly):
+            connection.execute('PRAGMA query_only=ON')
+        return connection
+
+    def _reader(self):
+        connection = getattr(self._local, 'connection', None)
+        if (connection == None):
+            connection = self._connect(readOnly=True)
+            self._local.connection = connection
+            with self._readersMutex:
+                self._readers.add(connection)
+        return connection
+
+    @contextmanager
+    def write(self):
+        """
+        Context manager that yields a cursor on the writer connection.
+        Commits when the block ends, rolls back if it raises. Reads inside the block see its uncommitted changes.
+        """
+        with self.writeMutex:
+            cursor = Cursor(self._writer.cursor(), True)
+            try:
+                yield cursor
+            except:
+                self._writer.rollback()
+                raise
+            start = time.perf_counter()
+            self._writer.commit()
+            self.commitSeconds += time.perf_counter() - start
+            self.commits += 1
+
+    def read(self, sql: str, parameters = ()):
+        """
+        Run a query on this thread's reader connection and return all rows
+        """
+        cursor = Cursor(self._reader().cursor(), False)
+        return cursor.execute(sql, parameters).fetchall()
+
+    def readOne(self, sql: str, parameters = ()):
+        """
+        Run a query on this thread's reader connection and return the first row or None
+        """
+        cursor = Cursor(self._reader().cursor(), False)
+        return cursor.execute(sql, parameters).fetchone()
+
+    def compact(self):
+        """
+        Return free pages to the file system and truncate the WAL. Runs off the hot path (see threads/logwriter.py).
+        Pages are only freed once the database uses incremental auto vacuum, see enableIncrementalVacuum().
+        Returns the number of pages freed.
+        """
+        freed = 0
+        while (True):
+            # free pages in steps so writers are not blocked for the whole vacuum
+            with self.writeMutex:
+                cursor = Cursor(self._writer.cursor(), True)
+                if (freed == 0 and cursor.execute('PRAGMA auto_vacuum').fetchone()['auto_vacuum'] != 2):
+                    cursor.execute('PRAGMA wal_checkpoint(TRUNCATE)').fetchall()
+                    return freed
+                pages = cursor.execute('PRAGMA freelist_count').fetchone()['freelist_count']
+                if (pages == 0):
+                    cursor.execute('PRAGMA wal_checkpoint(TRUNCATE)').fetchall()
+                    return freed
+                cursor.execute('PRAGMA incremental_vacuum(' + str(VACUUM_CHUNK) + ')').fetchall()
+                freed += min(pages, VACUUM_CHUNK)
+
+    def enableIncrementalVacuum(self):
+        """
+        Switch the database to incremental auto vacuum. Rewrites the whole file with a full VACUUM,
+        run it once with the server stopped: python database.py incremental-vacuum
+        Returns False if the database already uses incremental auto vacuum.
+        """
+        with self.writeMutex:
+            cursor = Cursor(self._writer.cursor(), True)
+            if (cursor.execute('PRAGMA auto_vacuum').fetchone()['auto_vacuum'] == 2):
+                return False
+            cursor.execute('PRAGMA auto_vacuum = INCREMENTAL')
+            cursor.execute('VACUUM')
+            cursor.execute('PRAGMA wal_checkpoint(TRUNCATE)').fetchall()
+            return True
+
+    def readerCount(self):
+        with self._readersMutex:
+            return len(self._readers)
+
+    def close(self):
+        with self._readersMutex:
+            readers = list(self._readers)
+            self._readers = weakref.WeakSet()
+        for connection in readers:
+            connection.close()
+        with self.writeMutex:
+            if (not self._closed):
+                self._closed = True
+                self._writer.close()
+
+class WriteBehind:
+    """
+    Write behind for a single UPDATE statement. put() marks a row dirty, repeated puts for the same row
+    keep only the newest parameters. Dirty rows are committed together in one transaction FLUSH_INTERVAL
+    seconds after the first put, or when flush() is called (durability barrier).
+    """
+
+    def __init__(self, db: Database, name: str, sql: str, interval: float = FLUSH_INTERVAL):
+        self._db = db
+        self.name = name
+        self._sql = sql
+        self._interval = interval
+        self._dirty = {} # key => parameters
+        self._mutex = threading.Lock()
+        self._flushMutex = threading.Lock() # keeps flushes in order
+        self._timer = None
+        self.puts = 0
+        self.coalesced = 0 # puts replaced by a newer put before they were written
+        self.flushes = 0
+        self.failures = 0 # flushes that failed, their rows are retried
+
+    def put(self, key, parameters):
+        with self._mutex:
+            if (key in self._dirty):
+                self.coalesced += 1
+            self._dirty[key] = parameters
+            self.puts += 1
+            self._arm()
+
+    def _arm(self):
+        # start the flush timer, call with _mutex held
+        if (self._timer == None):
+            self._timer = threading.Timer(self._interval, self.flush)
+            self._timer.daemon = True
+            self._timer.start()
+
+    def discard(self, key):
+        """
+        Forget a pending write, e.g. the row is being deleted
+        """
+        with self._mutex:
+            self._dirty.pop(key, None)
+
+    def pending(self):
+        with self._mutex:
+            return len(self._dirty)
+
+    def flush(self):
+        """
+        Commit all dirty rows. Returns when they are written.
+        """
+        with self._flushMutex:
+            with self._mutex:
+                rows = self._dirty
+                self._dirty = {}
+                if (self._timer != None):
+                    self._timer.cancel()
+                    self._timer = None
+            if (len(rows) == 0):
+                return None
+            try:
+                with self._db.write() as cursor:
+                    cursor.executemany(self._sql, rows.values())
+            except Exception as e:
+                logger.error('Unable to write ' + str(len(rows)) + ' ' + self.name + ' rows, retrying: ' + str(e))
+                self.failures += 1
+                self._retry(rows)
+                return None
+            self.flushes += 1
+
+    def _retry(self, rows: dict):
+        # put rows back unless a newer put replaced them in the meantime and write them with the next flush
+        with self._mutex:
+            for key, parameters in rows.items():
+                self._dirty.setdefault(key, parameters)
+            self._arm()
+
+if __name__ == "__main__":
+    import sys
+    if (sys.argv[1:] != ['incremental-vacuum']):
+        print('usage: python database.py incremental-vacuum')
+        sys.exit(1)
+    db = Database()
+    if (db.enableIncrementalVacuum()):
+        print('Switched ' + PATH + ' to incremental auto vacuum')
+    else:
+        print(PATH + ' already uses incremental auto vacuum')
+    db.close()
@@ -0,0 +1,87 @@
+"""
+ * Developed by Hutz Media Ltd. <info@hutzmedia.com>
+ * Copyright 2026-10-18
+ * See README.md
+"""
+
+import os
+import time
+
+import logging
+logger = logging.getLogger('piworkout-server')
+
+# inbound limits per namespace: (messages per second, burst)
+# override with FLOW_LIMITS="namespace=rate:burst,..." e.g. FLOW_LIMITS="player=20:40,file-upload=500:500"
+LIMITS = {
+    'client': (400, 800), # all messages from a single client
+    'default': (50, 100),
+    'up': (50, 100),
+    'ping': (50, 100),
+    'player': (100, 200),
+    'logs': (20, 40),
+    'file-upload': (2000, 2000), # 1 MB chunks, LAN speed uploads should never wait
+    'exercises': (10, 20),
+}
+
+def parseLimits(value: str):
+    """
+    Parse limits from environment string
+    """
+    limits = {}
+    for item in value.split(','):
+        item = item.strip()
+        if (item == ''):
+            continue
+        try:
+            name, limit = item.split('=')
+            rate, burst = limit.split(':')
+            limits[name.strip()] = (float(rate), float(burst))
+        except ValueError:
+            logger.warning('FLOW_LIMITS entry not understood: ' + item)
+    return limits
+
+LIMITS.update(parseLimits(os.getenv('FLOW_LIMITS', '')))
+
+class TokenBucket:
+    def __init__(self, rate: float, burst: float):
+        self.rate = rate
+        self.burst = burst
+        self._tokens = burst
+        self._last = time.monotonic()
+
+    def take(self, cost: float = 1):
+        """
+        Take tokens from bucket. Returns the number of seconds the caller should wait before handling the message.
+        """
+        now = time.monotonic()
+        self._tokens = min(self.burst, self._tokens + (now - self._last) * self.rate)
+        self._last = now
+        self._tokens -= cost
+        if (self._tokens >= 0):
+            return 0
+        return -self._tokens / self.rate
+
+class FlowControl:
+    """
+    Inbound flow control for a single client. A client wide bucket and a bucket per namespace.
+    Waiting stops reading from the websocket so TCP backpressure throttles the sender.
+    """
+
+    def __init__(self):
+        rate, burst = LIMITS['client']
+        self._client = TokenBucket(rate, burst)
+        self._namespaces = {}
+        self.throttled = 0 # number of messages that had to wait
+
+    def take(self, namespace: str):
+        if (not namespace in LIMITS):
+            namespace = 'default'
+        bucket = self._namespaces.get(namespace)
+        if (bucket == None):
+            rate, burst = LIMITS[namespace]
+            bucket = TokenBucket(rate, burst)
+            self._namespaces[namespace] = bucket
+        wait = max(self._client.take(), bucket.take())
+        if (wait > 0):
+            self.throttled += 1
+        return wait
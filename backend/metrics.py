@@ -0,0 +1,352 @@
+"""
+ * Developed by Hutz Media Ltd. <info@hutzmedia.com>
+ * Copyright 2026-10-18
+ * See README.md
+"""
+
+import threading
+import time
+import http
+import os
+import heapq
+import asyncio
+
+import logging
+logger = logging.getLogger('piworkout-server')
+
+# metrics in prometheus text format, served on http://BACKEND_HOST:BACKEND_PORT/metrics by the websocket server
+PATH = '/metrics'
+
+# counters, name => {labels => value}
+# labels is a tuple of (name, value) pairs so the same labels always map to the same entry
+_counters = {}
+_countersMutex = threading.Lock()
+
+# name => (type, help)
+DESCRIPTIONS = {
+    'piworkout_messages_in_total': ('counter', 'Messages received from clients'),
+    'piworkout_bytes_in_total': ('counter', 'Bytes received from clients'),
+    'piworkout_messages_out_total': ('counter', 'Messages queued for clients'),
+    'piworkout_bytes_out_total': ('counter', 'Bytes queued for clients'),
+    'piworkout_client_queue_policy_total': ('counter', 'Times a slow client queue policy has fired'),
+    'piworkout_clients': ('gauge', 'Connected websocket clients'),
+    'piworkout_client_queue_messages': ('gauge', 'Unsent messages per client'),
+    'piworkout_client_queue_bytes': ('gauge', 'Unsent bytes per client'),
+    'piworkout_downloader_queue_length': ('gauge', 'Videos waiting to be downloaded'),
+    'piworkout_downloader_progress': ('gauge', 'Progress of the video being downloaded (0-1)'),
+    'piworkout_sbgenerator_queue_length': ('gauge', 'Videos waiting for a storyboard'),
+    'piworkout_listfetch_duration_seconds': ('gauge', 'Duration of the last playlist fetch'),
+    'piworkout_sqlite_lock_wait_seconds_total': ('counter', 'Time spent waiting for the sqlite writer'),
+    'piworkout_sqlite_lock_acquisitions_total': ('counter', 'Number of times the sqlite writer was acquired'),
+    'piworkout_sqlite_commits_total': ('counter', 'Write transactions committed'),
+    'piworkout_sqlite_commit_seconds_total': ('counter', 'Time spent committing write transactions'),
+    'piworkout_sqlite_reader_connections': ('gauge', 'Open per-thread sqlite reader connections'),
+    'piworkout_sqlite_write_behind_pending': ('gauge', 'Saved rows waiting to be written'),
+    'piworkout_sqlite_write_behind_puts_total': ('counter', 'Rows saved through the write behind'),
+    'piworkout_sqlite_write_behind_coalesced_total': ('counter', 'Saved rows replaced by a newer save before they were written'),
+    'piworkout_sqlite_write_behind_flushes_total': ('counter', 'Write behind transactions'),
+    'piworkout_sqlite_write_behind_failures_total': ('counter', 'Write behind transactions that failed, their rows are retried'),
+    'piworkout_sqlite_statements_total': ('counter', 'sqlite statements executed'),
+    'piworkout_sqlite_statement_seconds_total': ('counter', 'Time spent executing sqlite statements'),
+    'piworkout_upload_written_bytes_total': ('counter', 'Upload bytes written to disk'),
+    'piworkout_upload_write_seconds_total': ('counter', 'Time spent writing upload chunks'),
+    'piworkout_upload_pending_bytes': ('gauge', 'Upload bytes waiting to be written'),
+    'piworkout_upload_stalls_total': ('counter', 'Times reading from an uploading client paused for the disk'),
+    'piworkout_upload_stall_seconds_total': ('counter', 'Time uploading clients were paused for the disk'),
+    'piworkout_log_pending': ('gauge', 'Log entries waiting to be written'),
+    'piworkout_log_written_total': ('counter', 'Log entries written'),
+    'piworkout_log_pruned_total': ('counter', 'Log entries deleted by the retention policy'),
+    'piworkout_log_write_failures_total': ('counter', 'Log writes that failed, their entries are retried'),
+    'piworkout_log_dropped_total': ('counter', 'Log entries dropped because too many were waiting to be written'),
+    'piworkout_log_maintenance_duration_seconds': ('gauge', 'Duration of the last log pruning and database compaction'),
+    'piworkout_handler_seconds': ('histogram', 'Time taken by namespace handlers'),
+    'piworkout_handler_errors_total': ('counter', 'Namespace handlers that raised an exception'),
+}
+
+def inc(name: str, amount: float = 1, **labels):
+    """
+    Increase counter (thread safe)
+    """
+    key = tuple(sorted(labels.items()))
+    with _countersMutex:
+        values = _counters.get(name)
+        if (values == None):
+            values = {}
+            _counters[name] = values
+        values[key] = values.get(key, 0) + amount
+
+class TimedLock:
+    """
+    threading.Lock that records how long callers waited to acquire it
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        self._lock = threading.Lock()
+        self.wait = 0.0 # total seconds spent waiting
+        self.acquisitions = 0
+
+    def acquire(self, blocking = True, timeout = -1):
+        start = time.perf_counter()
+        result = self._lock.acquire(blocking, timeout)
+        if (result):
+            # updated while holding the lock
+            self.wait += time.perf_counter() - start
+            self.acquisitions += 1
+        return result
+
+    def release(self):
+        self._lock.release()
+
+    def locked(self):
+        return self._lock.locked()
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, *args):
+        self.release()
+
+# handler latency
+# histogram bucket upper bounds in seconds, 0.1ms doubling up to ~105s
+BUCKETS = [0.0001 * (2 ** i) for i in range(21)]
+MAX_HISTOGRAMS = 200 # (namespace, action) pairs come from clients, later pairs are recorded as action 'other'
+SLOWEST_SAMPLES = 10 # slowest handler calls kept per log interval
+LATENCY_LOG_INTERVAL = int(os.getenv('LATENCY_LOG_INTERVAL', '300')) # seconds between latency log dumps, 0 to disable
+
+class Histogram:
+    """
+    Latency histogram with fixed buckets. Percentiles are interpolated within a bucket, max is exact.
+    """
+
+    def __init__(self):
+        self.counts = [0] * (len(BUCKETS) + 1) # last count is for values larger than the last bucket
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+        self.errors = 0
+
+    def observe(self, seconds: float, error: bool = False):
+        i = 0
+        while (i < len(BUCKETS) and seconds > BUCKETS[i]):
+            i += 1
+        self.counts[i] += 1
+        self.count += 1
+        self.sum += seconds
+        if (seconds > self.max):
+            self.max = seconds
+        if (error):
+            self.errors += 1
+
+    def percentile(self, p: float):
+        if (self.count == 0):
+            return 0.0
+        rank = p * self.count
+        cumulative = 0
+        for i, n in enumerate(self.counts):
+            if (n > 0 and cumulative + n >= rank):
+                lower = BUCKETS[i - 1] if i > 0 else 0.0
+                upper = BUCKETS[i] if i < len(BUCKETS) else self.max
+                return min(self.max, lower + (upper - lower) * (rank - cumulative) / n)
+            cumulative += n
+        return self.max
+
+    def toObject(self):
+        return {
+            'count': self.count,
+            'errors': self.errors,
+            'p50': self.percentile(0.5),
+            'p95': self.percentile(0.95),
+            'p99': self.percentile(0.99),
+            'max': self.max,
+            'mean': self.sum / self.count if self.count > 0 else 0.0,
+        }
+
+_histograms = {} # (namespace, action) => Histogram
+_slowest = [] # min heap of (seconds, time, namespace, action, client) for the current log interval
+_latencyMutex = threading.Lock()
+
+def observe(namespace: str, action: str, seconds: float, error: bool = False, client = None):
+    """
+    Record time taken by a handler (thread safe)
+    """
+    with _latencyMutex:
+        key = (namespace, action)
+        histogram = _histograms.get(key)
+        if (histogram == None):
+            if (len(_histograms) >= MAX_HISTOGRAMS):
+                key = (namespace, 'other')
+                histogram = _histograms.get(key)
+            if (histogram == None):
+                histogram = Histogram()
+                _histograms[key] = histogram
+        histogram.observe(seconds, error)
+
+        sample = (seconds, time.time(), namespace, action, client)
+        if (len(_slowest) < SLOWEST_SAMPLES):
+            heapq.heappush(_slowest, sample)
+        elif (seconds > _slowest[0][0]):
+            heapq.heapreplace(_slowest, sample)
+
+def latencyReport():
+    """
+    Latency of every namespace/action (slowest p99 first) and the slowest recent calls
+    """
+    with _latencyMutex:
+        handlers = []
+        for (namespace, action), histogram in _histograms.items():
+            obj = histogram.toObject()
+            obj['namespace'] = namespace
+            obj['action'] = action
+            handlers.append(obj)
+        slowest = sorted(_slowest, reverse=True)
+    handlers.sort(key=lambda obj: obj['p99'], reverse=True)
+    return {
+        'handlers': handlers,
+        'slowest': [{
+            'seconds': seconds,
+            'time': at,
+            'namespace': namespace,
+            'action': action,
+            'client': client,
+        } for seconds, at, namespace, action, client in slowest],
+    }
+
+def resetLatency():
+    with _latencyMutex:
+        _histograms.clear()
+        _slowest.clear()
+
+def logLatency():
+    """
+    Write latency report to the log and start a new interval for the slowest samples
+    """
+    report = latencyReport()
+    if (len(report['handlers']) == 0):
+        return None
+    logger.info('Handler latency (ms):')
+    for obj in report['handlers']:
+        logger.info(f"  {obj['namespace']}.{obj['action']} count={obj['count']} errors={obj['errors']} p50={obj['p50'] * 1000:.1f} p95={obj['p95'] * 1000:.1f} p99={obj['p99'] * 1000:.1f} max={obj['max'] * 1000:.1f}")
+    for obj in report['slowest']:
+        logger.info(f"  slow {obj['namespace']}.{obj['action']} {obj['seconds'] * 1000:.1f}ms client={obj['client']}")
+    with _latencyMutex:
+        _slowest.clear()
+
+async def logLatencyPeriodically():
+    while (LATENCY_LOG_INTERVAL > 0):
+        await asyncio.sleep(LATENCY_LOG_INTERVAL)
+        logLatency()
+
+def collect():
+    """
+    Collect gauges from the server and worker threads. Returns {name => [(labels, value)]}.
+    """
+    # imported here, these modules import metrics
+    import server, model, channel
+    from threads import downloader, sbgenerator, listfetch, filewriter, logwriter
+
+    result = {}
+    with server.clientsMutex:
+        clients = list(server.CLIENTS)
+    result['piworkout_clients'] = [((), len(clients))]
+    result['piworkout_client_queue_messages'] = [((('client', str(queue.id)),), len(queue)) for queue in clients]
+    result['piworkout_client_queue_bytes'] = [((('client', str(queue.id)),), queue.size()) for queue in clients]
+    result['piworkout_client_queue_policy_total'] = [((('policy', policy),), count) for policy, count in channel.COUNTERS.items()]
+
+    downloaderQueue, progress = downloader.THREAD.stats()
+    result['piworkout_downloader_queue_length'] = [((), downloaderQueue)]
+    result['piworkout_downloader_progress'] = [((), progress)]
+
+    with sbgenerator.THREAD.queueMutex:
+        result['piworkout_sbgenerator_queue_length'] = [((), len(sbgenerator.THREAD.generateQueue))]
+    result['piworkout_listfetch_duration_seconds'] = [((), listfetch.THREAD.lastFetchDuration)]
+
+    result['piworkout_upload_written_bytes_total'] = [((), filewriter.THREAD.written)]
+    result['piworkout_upload_write_seconds_total'] = [((), filewriter.THREAD.writeSeconds)]
+    result['piworkout_upload_pending_bytes'] = [((), filewriter.THREAD.pending)]
+    result['piworkout_upload_stalls_total'] = [((), filewriter.THREAD.stalls)]
+    result['piworkout_upload_stall_seconds_total'] = [((), filewriter.THREAD.stallSeconds)]
+
+    result['piworkout_sqlite_lock_wait_seconds_total'] = [((), model.db.writeMutex.wait)]
+    result['piworkout_sqlite_lock_acquisitions_total'] = [((), model.db.writeMutex.acquisitions)]
+    result['piworkout_sqlite_commits_total'] = [((), model.db.commits)]
+    result['piworkout_sqlite_commit_seconds_total'] = [((), model.db.commitSeconds)]
+    result['piworkout_sqlite_reader_connections'] = [((), model.db.readerCount())]
+    result['piworkout_log_pending'] = [((), model.log.pending())]
+    result['piworkout_log_written_total'] = [((), model.log.written)]
+    result['piworkout_log_pruned_total'] = [((), model.log.pruned)]
+    result['piworkout_log_write_failures_total'] = [((), model.log.failures)]
+    result['piworkout_log_dropped_total'] = [((), model.log.dropped)]
+    result['piworkout_log_maintenance_duration_seconds'] = [((), logwriter.THREAD.lastMaintenanceDuration)]
+    writeBehind = model.video._writeBehind
+    labels = (('table', writeBehind.name),)
+    result['piworkout_sqlite_write_behind_pending'] = [(labels, writeBehind.pending())]
+    result['piworkout_sqlite_write_behind_puts_total'] = [(labels, writeBehind.puts)]
+    result['piworkout_sqlite_write_behind_coalesced_total'] = [(labels, writeBehind.coalesced)]
+    result['piworkout_sqlite_write_behind_flushes_total'] = [(labels, writeBehind.flushes)]
+    result['piworkout_sqlite_write_behind_failures_total'] = [(labels, writeBehind.failures)]
+    return result
+
+def _formatLabels(labels):
+    if (len(labels) == 0):
+        return ''
+    values = []
+    for name, value in labels:
+        value = str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+        values.append(name + '="' + value + '"')
+    return '{' + ','.join(values) + '}'
+
+def render():
+    """
+    Render all metrics in prometheus text exposition format
+    """
+    metrics = collect()
+    with _countersMutex:
+        for name, values in _counters.items():
+            metrics[name] = list(values.items())
+
+    errors = []
+    with _latencyMutex:
+        histograms = [(key, list(histogram.counts), histogram.count, histogram.sum, histogram.errors) for key, histogram in _histograms.items()]
+    for (namespace, action), counts, count, total, errorCount in histograms:
+        errors.append(((('action', action), ('namespace', namespace)), errorCount))
+    metrics['piworkout_handler_errors_total'] = errors
+
+    lines = []
+    for name in sorted(metrics.keys()):
+        metricType, description = DESCRIPTIONS.get(name, ('untyped', ''))
+        lines.append('# HELP ' + name + ' ' + description)
+        lines.append('# TYPE ' + name + ' ' + metricType)
+        for labels, value in metrics[name]:
+            lines.append(name + _formatLabels(labels) + ' ' + repr(float(value)))
+
+    # histograms
+    name = 'piworkout_handler_seconds'
+    metricType, description = DESCRIPTIONS[name]
+    lines.append('# HELP ' + name + ' ' + description)
+    lines.append('# TYPE ' + name + ' ' + metricType)
+    for (namespace, action), counts, count, total, errorCount in histograms:
+        labels = (('action', action), ('namespace', namespace))
+        cumulative = 0
+        for i, upper in enumerate(BUCKETS):
+            cumulative += counts[i]
+            lines.append(name + '_bucket' + _formatLabels(labels + (('le', repr(upper)),)) + ' ' + repr(float(cumulative)))
+        lines.append(name + '_bucket' + _formatLabels(labels + (('le', '+Inf'),)) + ' ' + repr(float(count)))
+        lines.append(name + '_sum' + _formatLabels(labels) + ' ' + repr(total))
+        lines.append(name + '_count' + _formatLabels(labels) + ' ' + repr(float(count)))
+    return '\n'.join(lines) + '\n'
+
+async def processRequest(path, requestHeaders):
+    """
+    websockets process_request hook. Answer plain HTTP requests for the metrics path, let everything else continue with the websocket handshake.
+    render() waits for locks held by worker threads, it runs on the default executor so the event loop keeps serving clients.
+    """
+    if (path.split('?')[0] != PATH):
+        return None
+    try:
+        body = (await asyncio.get_running_loop().run_in_executor(None, render)).encode('utf-8')
+    except Exception as e:
+        logger.error('Error rendering metrics: ' + str(e))
+        return (http.HTTPStatus.INTERNAL_SERVER_ERROR, [], b'')
+    return (http.HTTPStatus.OK, [('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')], body)
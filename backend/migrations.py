@@ -0,0 +1,75 @@
+"""
+ * Developed by Hutz Media Ltd. <info@hutzmedia.com>
+ * Copyright 2026-10-18
+ * See README.md
+"""
+
+import time
+
+import logging
+logger = logging.getLogger('piworkout-server')
+
+# schema migrations, applied in order at startup. Never edit a released migration, add a new one.
+# each migration runs in its own transaction together with its schema_version row.
+# statements must be idempotent (IF NOT EXISTS), databases created before migrations existed already have the version 1 tables.
+MIGRATIONS = [
+    (1, 'create tables', [
+        'CREATE TABLE IF NOT EXISTS videos (id INTEGER PRIMARY KEY, `order` INT, videoId VARCHAR(255), source VARCHAR(255), url VARCHAR(255), filename VARCHAR(255), filesize INT, title VARCHAR(255), description TEXT, duration INT, position FLOAT, width INT, height INT, tbr INT, fps INT, vcodec VARCHAR(255), status INT, watchedUrl TEXT)',
+        'CREATE TABLE IF NOT EXISTS settings (id INTEGER PRIMARY KEY, name VARCHAR(255), value TEXT)',
+        'CREATE TABLE IF NOT EXISTS logs (id INTEGER PRIMARY KEY, video_id INTEGER, action VARCHAR(255), data TEXT, created_at INT)',
+        'CREATE TABLE IF NOT EXISTS routines (id INTEGER PRIMARY KEY, `order` INTEGER, name VARCHAR(255), description TEXT)',
+        'CREATE TABLE IF NOT EXISTS exercises (id INTEGER PRIMARY KEY, routineId INTEGER, `order` INT, name VARCHAR(255), tooltip TEXT, image VARCHAR(255), description TEXT, video_url TEXT)',
+    ]),
+    (2, 'add indexes', [
+        'CREATE INDEX IF NOT EXISTS videos_videoId ON videos (videoId)',
+        'CREATE INDEX IF NOT EXISTS logs_video_id_created_at ON logs (video_id, created_at)',
+        'CREATE INDEX IF NOT EXISTS exercises_routineId ON exercises (routineId)',
+        # settings used to be inserted with SELECT then INSERT, keep the newest row of any duplicates (the one loaded at startup)
+        'DELETE FROM settings WHERE id NOT IN (SELECT MAX(id) FROM settings GROUP BY name)',
+        'CREATE UNIQUE INDEX IF NOT EXISTS settings_name ON settings (name)',
+    ]),
+    (3, 'index log age', [
+        # log retention deletes by age, see LogModel.prune()
+        'CREATE INDEX IF NOT EXISTS logs_created_at ON logs (created_at)',
+    ]),
+    (4, 'index exercise order', [
+        # exercises are loaded grouped by routine in order, see RoutineModel
+        'CREATE INDEX IF NOT EXISTS exercises_routineId_order ON exercises (routineId, `order`)',
+        'DROP INDEX IF EXISTS exercises_routineId',
+    ]),
+]
+
+def version(cursor):
+    """
+    Current schema version, 0 for a new database
+    """
+    cursor.execute('CREATE TABLE IF NOT EXISTS schema_version (version INTEGER PRIMARY KEY, description TEXT, applied_at INT)')
+    row = cursor.execute('SELECT MAX(version) AS version FROM schema_version').fetchone()
+    return int(row['version'] or 0)
+
+def migrate(db):
+    """
+    Apply migrations newer than the database schema
+    """
+    with db.write() as cursor:
+        current = version(cursor)
+    for number, description, statements in MIGRATIONS:
+        if (number <= current):
+            continue
+        logger.info('Applying database migration ' + str(number) + ' (' + description + ')')
+        start = time.perf_counter()
+        with db.write() as cursor:
+            # sqlite3 only opens transactions for DML, begin explicitly so schema changes roll back too
+            cursor.execute('BEGIN')
+            for sql in statements:
+                cursor.execute(sql)
+            cursor.execute('INSERT INTO schema_version (version, description, applied_at) VALUES (?, ?, ?)', (number, description, int(time.time()),))
+        logger.info('  done in ' + str(round((time.perf_counter() - start) * 1000)) + 'ms')
+
+def reset(db):
+    """
+    Forget applied migrations so they run again (debug)
+    """
+    with db.write() as cursor:
+        version(cursor)
+        cursor.execute('DELETE FROM schema_version')
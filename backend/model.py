@@ -4,23 +4,21 @@
  * See README.md
 """
 
-import sqlite3
 import threading
 import time
 import json
-from dataclasses import dataclass
-from google.auth.transport.requests import Request
-from google.oauth2.credentials import Credentials
-import googleapiclient.discovery
-import googleapiclient.errors
+import itertools
+from dataclasses import dataclass, field
 from urllib.parse import urlparse, parse_qs
 import requests
-import yt_dlp
 import re
 import os
 import http.cookiejar as cookielib
 
-from threads import downloader, listfetch, sbgenerator
+import database
+import migrations
+
+from threads import downloader, listfetch
 from namespaces import videos
 
 import logging
@@ -34,43 +32,46 @@ STATUS_ENCODING = 4
 STATUS_COMPLETE = 5
 STATUS_DELETED = 6
 
-db = sqlite3.connect('./db/database.sqlite3', check_same_thread=False)
-
-def dict_factory(cursor, row):
-    d = {}
-    for idx, col in enumerate(cursor.description):
-        d[col[0]] = row[idx]
-    return d
-
-db.row_factory = dict_factory
-
-mutex = threading.Lock() # DB mutex
+db = database.Database('./db/database.sqlite3')
 
 DEBUG = False # default False # set debug to true to delete the DB and redownload every video from the playlist
+LOG_BATCH_SIZE = 500 # queued log entries that are written right away instead of waiting for the log writer thread
+LOG_MAX_PENDING = 10000 # queued log entries kept while writes fail, the oldest are dropped above this
+# log retention is opt-in, logs are the workout history. 0 keeps every log.
+LOG_RETENTION_DAYS = int(os.getenv('LOG_RETENTION_DAYS', '0')) # older logs are deleted
+LOG_MAX_PER_VIDEO = int(os.getenv('LOG_MAX_PER_VIDEO', '0')) # oldest logs of a video above this count are deleted
+LOG_PRUNE_CHUNK = 500 # logs deleted per transaction
+LOG_PAGE_SIZE = 100 # default logs per page, see LogModel.getPage()
+LOG_MAX_PAGE_SIZE = 500
+CHECK_INDEXES = DEBUG or os.getenv('MODEL_CHECK_INDEXES', '') == '1' # verify lookup indexes against the item lists after every change (slow)
 
 # initialize database
-with mutex:
-    #db.execute('DROP TABLE routines')
-    if (DEBUG):
-        db.execute('DROP TABLE videos')
-    db.execute('CREATE TABLE IF NOT EXISTS videos (id INTEGER PRIMARY KEY, `order` INT, videoId VARCHAR(255), source VARCHAR(255), url VARCHAR(255), filename VARCHAR(255), filesize INT, title VARCHAR(255), description TEXT, duration INT, position FLOAT, width INT, height INT, tbr INT, fps INT, vcodec VARCHAR(255), status INT, watchedUrl TEXT)')
-    db.execute('CREATE TABLE IF NOT EXISTS settings (id INTEGER PRIMARY KEY, name VARCHAR(255), value TEXT)')
-    db.execute('CREATE TABLE IF NOT EXISTS logs (id INTEGER PRIMARY KEY, video_id INTEGER, action VARCHAR(255), data TEXT, created_at INT)')
-    db.execute('CREATE TABLE IF NOT EXISTS routines (id INTEGER PRIMARY KEY, `order` INTEGER, name VARCHAR(255), description TEXT)')
-    db.execute('CREATE TABLE IF NOT EXISTS exercises (id INTEGER PRIMARY KEY, routineId INTEGER, `order` INT, name VARCHAR(255), tooltip TEXT, image VARCHAR(255), description TEXT, video_url TEXT)')
-    db.commit()
-    
+if (DEBUG):
+    with db.write() as cursor:
+        cursor.execute('DROP TABLE IF EXISTS videos')
+    migrations.reset(db)
+migrations.migrate(db)
+
 """
 # test downloading a specific video again
-with mutex:
-    db.execute('DELETE FROM videos WHERE id = 9')
-    db.commit()
+with db.write() as cursor:
+    cursor.execute('DELETE FROM videos WHERE id = 9')
 """
 
 # methods
 def close():
-    with mutex:
-        db.close()
+    log.flush()
+    video.flush()
+    db.close()
+
+_versions = itertools.count(1)
+
+def nextVersion():
+    """
+    Get a new version number for a model. Every call returns a number that has never been used (thread safe).
+    Caches compare versions to determine if a model has changed since the cache was built.
+    """
+    return next(_versions)
 
 # models
 class SettingsModel:
@@ -86,16 +87,13 @@ class SettingsModel:
         'ytDlpArgv': '',
     }
     _dataMutex = threading.Lock()
+    version = 0 # changes every time settings change
 
-    def __init__(self, db, mutex):
+    def __init__(self, db):
         self._db = db
-        self._mutex = mutex
 
         # load settings into memory
-        with (self._mutex):
-            cursor = self._db.cursor()
-            cursor.execute('SELECT name, value FROM settings')
-            rows = cursor.fetchall()
+        rows = self._db.read('SELECT name, value FROM settings')
         with (self._dataMutex):
             for row in rows:
                 self._data[row['name']] = row['value']
@@ -127,33 +125,26 @@ class SettingsModel:
             if not name in self._data:
                 return None
             self._data[name] = value
+            self.version = nextVersion()
 
-        with self._mutex:
-            cursor = self._db.cursor()
-            cursor.execute('SELECT id FROM settings WHERE name = ?', (name,))
-            settingId = cursor.fetchone()
-            if (settingId == None):
-                cursor.execute('INSERT INTO settings (name, value) VALUES (?, ?)', (name, value,))
-            else:
-                cursor.execute('UPDATE settings SET value = ? WHERE id = ?', (value, settingId['id'],))
-            self._db.commit()
+        with self._db.write() as cursor:
+            cursor.execute('INSERT INTO settings (name, value) VALUES (?, ?) ON CONFLICT (name) DO UPDATE SET value = excluded.value', (name, value,))
             return value
 
     def delete(self, name: str):
         with self._dataMutex:
             self._data[name] = ''
-        with self._mutex:
-            cursor = self._db.cursor()
+            self.version = nextVersion()
+        with self._db.write() as cursor:
             cursor.execute('DELETE FROM settings WHERE name = ?', (name,))
-            self._db.commit()
 
-settings = SettingsModel(db, mutex)
+settings = SettingsModel(db)
 
 # routines
 @dataclass
 class Exercise:
     id: int = 0
-    rotuineId: int = 0,
+    routineId: int = 0
     order: int = 0
     name: str = ''
     tooltip: str = ''
@@ -164,7 +155,7 @@ class Exercise:
     def toObject(self):
         return {
             'id': int(self.id),
-            'rotuineId': int(self.rotuineId),
+            'routineId': int(self.routineId),
             'order': int(self.order),
             'name': str(self.name),
             'tooltip': str(self.name),
@@ -197,17 +188,19 @@ class Routine:
 class RoutineModel:
     _items = []
     _dataMutex = threading.Lock()
+    version = 0 # changes every time a routine or exercise changes
 
-    def __init__(self, db, mutex, settings):
+    def __init__(self, db, settings):
         self._db = db
-        self._mutex = mutex
         self._settings = settings
-
-        # load routines and exercises into memory
-        with self._mutex:
-            cursor = self._db.cursor()
-            cursor.execute('SELECT id, `order`, name, description FROM routines ORDER BY `order`')
-            rows = cursor.fetchall()
+        # every model has its own items, the class attributes are shared between instances
+        self._items = []
+        self._byId = {} # routine id => routine
+        self._exercisesById = {} # routine id => {exercise id => exercise}
+
+        # load routines and exercises into memory, exercises come grouped by routine (exercises_routineId_order index)
+        rows = self._db.read('SELECT id, `order`, name, description FROM routines ORDER BY `order`')
+        exerciseRows = self._db.read('SELECT id, routineId, `order`, name, tooltip, image, description, video_url FROM exercises ORDER BY routineId, `order`')
         with self._dataMutex:
             for row in rows:
                 routine = Routine(
@@ -219,11 +212,16 @@ class RoutineModel:
                 )
                 self._items.append(routine)
                 
-            with self._mutex:
-                rows2 = cursor.execute('SELECT id, `order`, name, tooltip, image, description, video_url FROM exercises ORDER BY `order`')
-            for row in rows2:
+            byId = {routine.id: routine for routine in self._items}
+            orphans = 0
+            for row in exerciseRows:
+                routine = byId.get(row['routineId'])
+                if (routine == None):
+                    orphans += 1
+                    continue
                 exercise = Exercise(
                     id=int(row['id'] or 0),
+                    routineId=routine.id,
                     order=int(row['order'] or 0),
                     name=row['name'],
                     tooltip=row['tooltip'],
@@ -232,7 +230,9 @@ class RoutineModel:
                     video_url=row['video_url']
                 )
                 routine.exercises.append(exercise)
-            rows = cursor.fetchall()
+            if (orphans > 0):
+                logger.warning('Ignoring ' + str(orphans) + ' exercises without a routine.')
+            self._reindex()
 
     def data(self, copy:bool = True, lock:bool = True):
         if (lock):
@@ -247,26 +247,63 @@ class RoutineModel:
 
     def dataMutex(self):
         return self._dataMutex
+
+    def touch(self):
+        """
+        Mark model as changed
+        """
+        self.version = nextVersion()
+
+    def _reindex(self, routine: Routine = None):
+        """
+        Rebuild lookup indexes from the items, only for routine's exercises if given. Call with the data mutex held.
+        """
+        if (routine == None):
+            self._byId = {item.id: item for item in self._items}
+            self._exercisesById = {item.id: {exercise.id: exercise for exercise in (item.exercises or [])} for item in self._items}
+        else:
+            self._exercisesById[routine.id] = {exercise.id: exercise for exercise in (routine.exercises or [])}
+        if (CHECK_INDEXES):
+            self.checkIndexes()
+
+    def checkIndexes(self):
+        """
+        Log lookup index entries that do not match the items (debug)
+        """
+        byId = {item.id: item for item in self._items}
+        if (byId.keys() != self._byId.keys() or any(self._byId[id] is not item for id, item in byId.items())):
+            logger.error('routine index out of sync: items=' + str(sorted(byId.keys())) + ', index=' + str(sorted(self._byId.keys())))
+        for item in self._items:
+            exercises = {exercise.id: exercise for exercise in (item.exercises or [])}
+            index = self._exercisesById.get(item.id, {})
+            if (exercises.keys() != index.keys() or any(index[id] is not exercise for id, exercise in exercises.items())):
+                logger.error('exercise index of routine id=' + str(item.id) + ' out of sync: items=' + str(sorted(exercises.keys())) + ', index=' + str(sorted(index.keys())))
     
     def insert(self, routine: Routine):
-        with self._mutex:
+        with self._db.write() as cursor:
             # save to DB (if not exists)
-            cursor = self._db.cursor()
             cursor.execute('INSERT INTO routines (name) VALUES ("")')
             routine.id = cursor.lastrowid
             logger.debug('Inserted routine into DB id=' + str(routine.id))
-            self._db.commit()
+        with self._dataMutex:
             self._items.append(routine)
+            self._byId[routine.id] = routine
+            self._reindex(routine)
+            self.touch()
             
     def insertExercise(self, routine: Routine, exercise: Exercise):
-        with self._mutex:
+        with self._db.write() as cursor:
             # save to DB (if not exists)
-            cursor = self._db.cursor()
-            cursor.execute('INSERT INTO exercises (rotuineId) VALUES (?)', (routine.id,))
+            cursor.execute('INSERT INTO exercises (routineId) VALUES (?)', (routine.id,))
             exercise.id = cursor.lastrowid
+            exercise.routineId = routine.id
             logger.debug('Inserted exercise into DB id=' + str(exercise.id))
+        with self._dataMutex:
             routine.exercises.append(exercise)
-            self._db.commit()
+            self._exercisesById.setdefault(routine.id, {})[exercise.id] = exercise
+            if (CHECK_INDEXES):
+                self.checkIndexes()
+            self.touch()
 
     def save(self, routine: Routine, lock: bool = True):
         """
@@ -274,12 +311,53 @@ class RoutineModel:
         """
         if (lock):
             self._dataMutex.acquire()
-        with self._mutex:
-            cursor = self._db.cursor()
+        with self._db.write() as cursor:
             cursor.execute('UPDATE routines SET `order` = ?, name = ?, description = ? WHERE id = ?', (routine.order, routine.name, routine.description, routine.id,))
-            self._db.commit()
+        self._reindex(routine) # callers may replace the exercises list
+        self.touch()
+        if (lock):
+            self._dataMutex.release()
+            
+    def saveMany(self, routines: list, lock: bool = True):
+        """
+        Save routines to database in one transaction
+        """
+        if (lock):
+            self._dataMutex.acquire()
+        with self._db.write() as cursor:
+            cursor.executemany('UPDATE routines SET `order` = ?, name = ?, description = ? WHERE id = ?', [(routine.order, routine.name, routine.description, routine.id,) for routine in routines])
+        for routine in routines:
+            self._reindex(routine)
+        self.touch()
         if (lock):
             self._dataMutex.release()
+
+    def reorder(self, ids: list, lock: bool = True):
+        """
+        Order routines as listed in ids, routines missing from ids keep their relative order after them
+        """
+        if (lock):
+            self._dataMutex.acquire()
+        self._items = self._ordered(self._items, self._byId, ids)
+        self.saveMany(self._items, lock=False)
+        if (lock):
+            self._dataMutex.release()
+
+    def _ordered(self, items: list, byId: dict, ids: list):
+        # items in the order of ids followed by the remaining items, order fields are set to the new position
+        listed = set()
+        result = []
+        for id in ids:
+            item = byId.get(id)
+            if (item != None and id not in listed):
+                listed.add(id)
+                result.append(item)
+        for item in items:
+            if (item.id not in listed):
+                result.append(item)
+        for index, item in enumerate(result):
+            item.order = index
+        return result
             
     def saveExercise(self, routine: Routine, exercise: Exercise, lock: bool = True):
         """
@@ -287,10 +365,32 @@ class RoutineModel:
         """
         if (lock):
             self._dataMutex.acquire()
-        with self._mutex:
-            cursor = self._db.cursor()
+        with self._db.write() as cursor:
             cursor.execute('UPDATE exercises SET routineId = ?, `order` = ?, name = ?, tooltip = ?, image = ?, description = ?, video_url = ? WHERE id = ?', (exercise.routineId, exercise.order, exercise.name, exercise.tooltip, exercise.image, exercise.description, exercise.video_url, exercise.id,))
-            self._db.commit()
+        self.touch()
+        if (lock):
+            self._dataMutex.release()
+
+    def saveExercises(self, routine: Routine, exercises: list, lock: bool = True):
+        """
+        Save exercises of a routine to database in one transaction
+        """
+        if (lock):
+            self._dataMutex.acquire()
+        with self._db.write() as cursor:
+            cursor.executemany('UPDATE exercises SET routineId = ?, `order` = ?, name = ?, tooltip = ?, image = ?, description = ?, video_url = ? WHERE id = ?', [(routine.id, exercise.order, exercise.name, exercise.tooltip, exercise.image, exercise.description, exercise.video_url, exercise.id,) for exercise in exercises])
+        self.touch()
+        if (lock):
+            self._dataMutex.release()
+
+    def reorderExercises(self, routine: Routine, ids: list, lock: bool = True):
+        """
+        Order exercises of a routine as listed in ids, exercises missing from ids keep their relative order after them
+        """
+        if (lock):
+            self._dataMutex.acquire()
+        routine.exercises = self._ordered(routine.exercises, self._exercisesById.get(routine.id, {}), ids)
+        self.saveExercises(routine, routine.exercises, lock=False)
         if (lock):
             self._dataMutex.release()
 
@@ -302,16 +402,20 @@ class RoutineModel:
             self._items.remove(routine)
         except:
             pass
+        if (self._byId.get(routine.id) is routine):
+            del self._byId[routine.id]
+            self._exercisesById.pop(routine.id, None)
+        if (CHECK_INDEXES):
+            self.checkIndexes()
             
         for t in self._items:
             logger.debug('  id=' + str(t.id))
 
-        with self._mutex:
-            cursor = self._db.cursor()
+        with self._db.write() as cursor:
             # delete routine and exercises records
             cursor.execute('DELETE FROM exercises WHERE routineId = ?', (routine.id,))
             cursor.execute('DELETE FROM routines WHERE id = ?', (routine.id,))
-            self._db.commit()
+        self.touch()
 
         if (lock):
             self._dataMutex.release()
@@ -321,15 +425,19 @@ class RoutineModel:
             self._dataMutex.acquire()
         logger.debug('model.routine().removeExercise() removing id=' + str(exercise.id))
         try:
-            routine.remove(exercise)
+            routine.exercises.remove(exercise)
         except:
             pass
+        index = self._exercisesById.get(routine.id)
+        if (index != None and index.get(exercise.id) is exercise):
+            del index[exercise.id]
+        if (CHECK_INDEXES):
+            self.checkIndexes()
             
-        with self._mutex:
-            cursor = self._db.cursor()
+        with self._db.write() as cursor:
             # delete exercise record
             cursor.execute('DELETE FROM exercises WHERE id = ?', (exercise.id,))
-            self._db.commit()
+        self.touch()
 
         if (lock):
             self._dataMutex.release()
@@ -349,6 +457,8 @@ class RoutineModel:
         if (lock):
             self._dataMutex.acquire()
         self._items = items
+        self._reindex()
+        self.touch()
         if (lock):
             self._dataMutex.release()
             
@@ -364,17 +474,23 @@ class RoutineModel:
         """
         if (lock):
             self._dataMutex.acquire()
-        routine = None
-        for item in self._items:
-            #print('== ', item.id, id)
-            if (item.id == id):
-                routine = item
-                break
+        routine = self._byId.get(id)
         if (lock):
             self._dataMutex.release()
         return routine
+
+    def exerciseById(self, routine: Routine, id: int, lock: bool = True):
+        """
+        Get exercise of routine by id
+        """
+        if (lock):
+            self._dataMutex.acquire()
+        exercise = self._exercisesById.get(routine.id, {}).get(id)
+        if (lock):
+            self._dataMutex.release()
+        return exercise
     
-routines = RoutineModel(db, mutex, settings)
+routines = RoutineModel(db, settings)
 
 # videos
 @dataclass
@@ -396,8 +512,10 @@ class VideoProgress:
             'elapsed': self.elapsed,
         }
 
-@dataclass
+
+@dataclass(slots=True)
 class Video:
+    _cache: dict = field(default=None, init=False, repr=False, compare=False) # encoded fields, see toObject()
     id: int = 0
     order: int = 0
     videoId: str = ''
@@ -419,14 +537,22 @@ class Video:
     progress: VideoProgress = None
 
     # the following fields are only for cache and are only requested from YouTube when the video is played
-    channelName: str = '',
-    channelImageUrl: str = '',
-    date: str = '',
-    views: int = 0,
-    likes: int = 0,
-    rating: str = 'none',
-    sponsorblock: dict | None = None,
-    playlistItemId: str = '',
+    channelName: str = ''
+    channelImageUrl: str = ''
+    date: str = ''
+    views: int = 0
+    likes: int = 0
+    rating: str = 'none'
+    sponsorblock: dict | None = None
+    playlistItemId: str = ''
+
+    def __setattr__(self, name, value):
+        object.__setattr__(self, name, value)
+        cache = self._cache
+        if (cache != None):
+            # only this field is encoded again by the next toObject(), a single dict operation needs no lock
+            # fields are assigned from threads that do not hold the data mutex (e.g. downloader)
+            cache.pop(name, None)
     
     @staticmethod
     def createFromRow(row):
@@ -461,63 +587,82 @@ class Video:
         return video
 
     def toObject(self):
+        """
+        Video as sent to clients. Fields are encoded once and cached until they are assigned again,
+        progress is encoded on every call because the downloader changes it in place.
+        """
+        cache = self._cache
+        if (cache == None):
+            cache = {}
+            object.__setattr__(self, '_cache', cache)
+        obj = cache.copy()
+        if (len(obj) != len(_VIDEO_ENCODERS)):
+            for name, encode in _VIDEO_ENCODERS.items():
+                if (not name in obj):
+                    value = getattr(self, name)
+                    obj[name] = encode(value) if (encode != None) else value
+                    cache[name] = obj[name]
+                    if (getattr(self, name) is not value):
+                        # assigned while encoding, the assignment may have cleared the entry before it was stored
+                        cache.pop(name, None)
         if (self.progress):
-            pObj = self.progress.toObject()
-        else:
-            pObj = None
-        return {
-            'id': int(self.id),
-            'order': int(self.order),
-            'videoId': str(self.videoId),
-            'source': str(self.source),
-            'url': str(self.url),
-            'filename': str(self.filename),
-            'filesize': int(self.filesize or 0),
-            'title': str(self.title),
-            'description': str(self.description),
-            'duration': int(self.duration),
-            'position': float(self.position),
-            'width': int(self.width),
-            'height': int(self.height),
-            'tbr': int(self.tbr),
-            'fps': int(self.fps),
-            'vcodec': str(self.vcodec),
-            'status': int(self.status),
-            'progress': pObj,
-
-            # additional
-            'channelName': self.channelName,
-            'channelImageUrl': self.channelImageUrl,
-            'date': self.date,
-            'views': self.views,
-            'likes': self.likes,
-            'rating': self.rating,
-            'sponsorblock': self.sponsorblock,
-            'playlistItemId': self.playlistItemId,
-        }
+            obj['progress'] = self.progress.toObject()
+        return obj
+
+# attribute => encoder of the fields in Video.toObject(), None sends the value as is
+_VIDEO_ENCODERS = dict((
+    ('id', int),
+    ('order', int),
+    ('videoId', str),
+    ('source', str),
+    ('url', str),
+    ('filename', str),
+    ('filesize', lambda value: int(value or 0)),
+    ('title', str),
+    ('description', str),
+    ('duration', int),
+    ('position', float),
+    ('width', int),
+    ('height', int),
+    ('tbr', int),
+    ('fps', int),
+    ('vcodec', str),
+    ('status', int),
+    ('progress', lambda value: None), # encoded by toObject() on every call
+
+    # additional
+    ('channelName', None),
+    ('channelImageUrl', None),
+    ('date', None),
+    ('views', None),
+    ('likes', None),
+    ('rating', None),
+    ('sponsorblock', None),
+    ('playlistItemId', None),
+))
 
 class VideoModel:
     _items = []
     _dataMutex = threading.Lock()
+    version = 0 # changes every time a video changes, see touch()
 
-    def __init__(self, db, mutex, settings):
+    def __init__(self, db, settings):
         self._db = db
-        self._mutex = mutex
         self._settings = settings
+        # every model has its own items, the class attributes are shared between instances
+        self._items = []
+        self._byId = {} # id => video
+        self._byVideoId = {} # videoId => first video in _items with that videoId
+        # position saves, progress status changes and reorders touch the same rows many times, see save()
+        self._writeBehind = database.WriteBehind(db, 'videos', 'UPDATE videos SET `order` = ?, videoId = ?, source=?, url = ?, filename = ?, filesize = ?, title = ?, description = ?, duration = ?, position = ?, width = ?, height = ?, tbr = ?, fps = ?, vcodec = ?, status = ?, watchedUrl = ? WHERE id = ?')
 
         if (DEBUG):
-            with self._mutex:
-                logger.debug('debug=True Deleting videos.')
-                cursor = self._db.cursor()
+            logger.debug('debug=True Deleting videos.')
+            with self._db.write() as cursor:
                 cursor.execute('DELETE FROM videos')
-                self._db.commit()
 
         # load videos into memory
-        with self._mutex:
-            cursor = self._db.cursor()
-            cursor.execute('SELECT id, `order`, videoId, source, url, filename, filesize, title, description, duration, position, width, height, tbr, fps, vcodec, status, watchedUrl FROM videos ORDER BY `order`')
-            rows = cursor.fetchall()
-            columns = cursor.description
+        rows = self._db.read('SELECT id, `order`, videoId, source, url, filename, filesize, title, description, duration, position, width, height, tbr, fps, vcodec, status, watchedUrl FROM videos ORDER BY `order`')
         with self._dataMutex:
             for row in rows:
                 video = Video.createFromRow(row)                
@@ -525,10 +670,8 @@ class VideoModel:
                 if (video.status == STATUS_INIT):
                     # add to downloader queue
                     downloader.THREAD.append(video)
-                    
-                if (not os.path.exists('/videos/' + str(video.id) + '-' + video.filename + '.sbb')):
-                    # generate sb
-                    sbgenerator.append(video)
+            self._reindex()
+        # missing storyboards are found by the sbgenerator thread once it starts
 
     def data(self, copy:bool = True, lock:bool = True):
         if (lock):
@@ -543,30 +686,84 @@ class VideoModel:
 
     def dataMutex(self):
         return self._dataMutex
+
+    def touch(self):
+        """
+        Mark model as changed. Call after changing a video in memory without save() (e.g. download progress).
+        """
+        self.version = nextVersion()
+
+    def _reindex(self):
+        """
+        Rebuild lookup indexes from the items. Call with the data mutex held.
+        """
+        self._byId = {}
+        self._byVideoId = {}
+        for item in self._items:
+            self._index(item)
+        if (CHECK_INDEXES):
+            self.checkIndexes()
+
+    def _index(self, video: Video):
+        self._byId.setdefault(video.id, video)
+        self._byVideoId.setdefault(video.videoId, video)
+
+    def _unindex(self, video: Video):
+        if (self._byId.get(video.id) is video):
+            del self._byId[video.id]
+        if (self._byVideoId.get(video.videoId) is video):
+            del self._byVideoId[video.videoId]
+            # another video with the same videoId (e.g. added twice) takes its place
+            for item in self._items:
+                if (item.videoId == video.videoId):
+                    self._byVideoId[video.videoId] = item
+                    break
+        if (CHECK_INDEXES):
+            self.checkIndexes()
+
+    def checkIndexes(self):
+        """
+        Log lookup index entries that do not match the items (debug)
+        """
+        byId = {}
+        byVideoId = {}
+        for item in self._items:
+            byId.setdefault(item.id, item)
+            byVideoId.setdefault(item.videoId, item)
+        for name, expected, index in (('id', byId, self._byId), ('videoId', byVideoId, self._byVideoId)):
+            if (expected.keys() != index.keys() or any(index[key] is not item for key, item in expected.items())):
+                logger.error('video ' + name + ' index out of sync: items=' + str(len(expected)) + ', index=' + str(len(index)))
     
     def insert(self, video: Video):
-        with self._mutex:
+        """
+        Insert the complete row, it is committed before this returns (not written behind)
+        """
+        with self._db.write() as cursor:
             # save to DB (if not exists)
-            cursor = self._db.cursor()
-            cursor.execute('INSERT INTO videos (videoId) VALUES (?)', (video.videoId,))
+            cursor.execute('INSERT INTO videos (`order`, videoId, source, url, filename, filesize, title, description, duration, position, width, height, tbr, fps, vcodec, status, watchedUrl) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)', (video.order, video.videoId, video.source, video.url, video.filename, video.filesize, video.title, video.description, video.duration, video.position, video.width, video.height, video.tbr, video.fps, video.vcodec, video.status, video.watchedUrl,))
             video.id = cursor.lastrowid
             logger.debug('Inserted video into DB id=' + str(video.id))
-            self._db.commit()
+        self.touch()
 
     def save(self, video: Video, lock: bool = True):
         """
-        Save data to database
+        Save data to database. The row is written shortly after together with other saves, call flush() when it must be on disk.
         """
         if (lock):
             self._dataMutex.acquire()
-        with self._mutex:
-            cursor = self._db.cursor()
-            cursor.execute('UPDATE videos SET `order` = ?, videoId = ?, source=?, url = ?, filename = ?, filesize = ?, title = ?, description = ?, duration = ?, position = ?, width = ?, height = ?, tbr = ?, fps = ?, vcodec = ?, status = ?, watchedUrl = ? WHERE id = ?', (video.order, video.videoId, video.source, video.url, video.filename, video.filesize, video.title, video.description, video.duration, video.position, video.width, video.height, video.tbr, video.fps, video.vcodec, video.status, video.watchedUrl, video.id,))
-            self._db.commit()
+        self._writeBehind.put(video.id, (video.order, video.videoId, video.source, video.url, video.filename, video.filesize, video.title, video.description, video.duration, video.position, video.width, video.height, video.tbr, video.fps, video.vcodec, video.status, video.watchedUrl, video.id,))
+        self.touch()
         if (lock):
             self._dataMutex.release()
 
+    def flush(self):
+        """
+        Write saved videos to the database now
+        """
+        self._writeBehind.flush()
+
     def remove(self, video: Video, lock: bool = True):
+        log.flush() # queued logs of this video are deleted below, callers holding the data mutex flush before taking it so this is empty
         if (lock):
             self._dataMutex.acquire()
         logger.debug('model.video().remove() removing id=' + str(video.id) + ', videoId=' + video.videoId)
@@ -574,11 +771,12 @@ class VideoModel:
             self._items.remove(video)
         except:
             pass
+        self._unindex(video)
             
         downloader.THREAD.remove(video) # remove from download queue
+        self._writeBehind.discard(video.id)
 
-        with self._mutex:
-            cursor = self._db.cursor()
+        with self._db.write() as cursor:
             # get video id so we can delete logs
             cursor.execute('SELECT id FROM videos WHERE videoId = ?', (video.videoId,))
             id = cursor.fetchone()
@@ -588,7 +786,7 @@ class VideoModel:
             
             # delete video record
             cursor.execute('DELETE FROM videos WHERE videoId = ?', (video.videoId,))
-            self._db.commit()
+        self.touch()
 
         if (lock):
             self._dataMutex.release()
@@ -609,6 +807,8 @@ class VideoModel:
         if (lock):
             self._dataMutex.acquire()
         self._items = items
+        self._reindex()
+        self.touch()
         if (lock):
             self._dataMutex.release()
             
@@ -624,11 +824,7 @@ class VideoModel:
         """
         if (lock):
             self._dataMutex.acquire()
-        video = None
-        for item in self._items:
-            if (item.videoId == videoId):
-                video = item
-                break
+        video = self._byVideoId.get(videoId)
         if (lock):
             self._dataMutex.release()
         return video
@@ -639,11 +835,7 @@ class VideoModel:
         """
         if (lock):
             self._dataMutex.acquire()
-        video = None
-        for item in self._items:
-            if (item.id == id):
-                video = item
-                break
+        video = self._byId.get(id)
         if (lock):
             self._dataMutex.release()
         return video
@@ -663,6 +855,11 @@ class VideoModel:
         """
         Get youtube API object
         """
+        # google api client is slow to import, only import once it is needed
+        import googleapiclient.discovery
+        from google.auth.transport.requests import Request
+        from google.oauth2.credentials import Credentials
+
         api_service_name = "youtube"
         api_version = "v3"
         youtube = None
@@ -730,24 +927,21 @@ class VideoModel:
         #logger.debug(json.dumps(item))
         url = f'https://www.youtube.com/watch?v={videoId}'
                     
-        with self._mutex:
-            # check if exists in DB
-            cursor = self._db.cursor()
-            cursor.execute('SELECT id FROM videos WHERE videoId = ?', (videoId,))
-            row = cursor.fetchone()
-            if (row != None):
-                # found
-                #logger.debug(f'  Already exists videoId={videoId}')
-                aVideo = self.byVideoId(videoId=videoId, lock=False)
-                if (aVideo == None):
-                    # not found in memory
-                    logger.error('video id=' + videoId + ' not found in memory.')
-                    return
-                sharedObject['ytVideos'].append(aVideo)
-                
-                # set playlist item id
-                aVideo.playlistItemId = playlistItemId
-                return aVideo
+        # check if exists in DB
+        row = self._db.readOne('SELECT id FROM videos WHERE videoId = ?', (videoId,))
+        if (row != None):
+            # found
+            #logger.debug(f'  Already exists videoId={videoId}')
+            aVideo = self.byVideoId(videoId=videoId, lock=False)
+            if (aVideo == None):
+                # not found in memory
+                logger.error('video id=' + videoId + ' not found in memory.')
+                return
+            sharedObject['ytVideos'].append(aVideo)
+            
+            # set playlist item id
+            aVideo.playlistItemId = playlistItemId
+            return aVideo
 
         # set video information
         # https://github.com/yt-dlp/yt-dlp/blob/master/yt_dlp/YoutubeDL.py
@@ -755,6 +949,7 @@ class VideoModel:
             #'cookiefile': './db/cookies.txt', # disabled cookies
         }
 
+        import yt_dlp
         with yt_dlp.YoutubeDL(ydl_opts) as ydl:
             logger.debug('getting file information from youtube')
             info = ydl.extract_info(url, download = False)
@@ -792,7 +987,6 @@ class VideoModel:
         sharedObject['ytVideos'].append(video)
         sharedObject['change'] = True
         self.insert(video=video)
-        self.save(video = video, lock = False)
         
         # log added
         log.create({
@@ -813,6 +1007,10 @@ class VideoModel:
         logger.info(f' Adding videoId={video.videoId}')
         with self._dataMutex:
             self._items.append(video)
+            self._index(video)
+            if (CHECK_INDEXES):
+                self.checkIndexes()
+            self.touch()
 
         # add to downloader queue
         downloader.THREAD.append(video)
@@ -849,15 +1047,13 @@ class VideoModel:
             self.createYoutubeVideo(videoId=item['contentDetails']['videoId'], playlistItemId=item['id'], sharedObject=sharedObject)
 
         # check for deleted youtube videos
+        ytVideoIds = set(cVideo.videoId for cVideo in sharedObject['ytVideos'])
+        log.flush() # remove() deletes the logs of removed videos, write queued logs before taking the data mutex
         with self._dataMutex:
             for video in self._items.copy():
                 if video.source != 'youtube':
                     continue
-                found = False
-                for cVideo in sharedObject['ytVideos']:
-                    if (cVideo.videoId == video.videoId):
-                        found = True
-                        break
+                found = video.videoId in ytVideoIds
                 if (not found):
                     # delete
                     #logger.info('  removing id=' + str(video.id) + ', videoId=' + video.videoId)
@@ -886,43 +1082,156 @@ class VideoModel:
                 else:
                     nItems.append(video)
             self._items = nItems
+            self._reindex()
+            self.touch()
 
         if (sharedObject['change']):
             logger.debug('broadcasting changed list of videos.')
             videos.broadcast()
         logger.info('done fetch')
 
-video = VideoModel(db, mutex, settings)
+video = VideoModel(db, settings)
 
 
 class LogModel:
-    def __init__(self, db, mutex, settings):
+    def __init__(self, db, settings):
         self._db = db
-        self._mutex = mutex
         self._settings = settings
+        self._pending = [] # (video_id, action, data, created_at) waiting to be written, see flush()
+        self._pendingMutex = threading.Lock()
+        self._flushMutex = threading.Lock() # keeps batches in order
+        self._failing = False # the last flush failed, the log writer thread retries instead of create()
+        self.written = 0
+        self.pruned = 0
+        self.failures = 0 # flushes that failed, their entries are retried
+        self.dropped = 0 # entries dropped above LOG_MAX_PENDING
         
     def create(self, obj):
-        with self._mutex:
-            cursor = self._db.cursor()
-            cursor.execute('INSERT INTO logs (video_id, action, data, created_at) VALUES (?, ?, ?, ?)', (obj['video_id'], obj['action'], obj['data'], int(time.time()),))
-            id = cursor.lastrowid
-            logger.debug('Inserted log into DB id=' + str(obj['video_id']))
-            self._db.commit()
+        """
+        Queue log entry. Entries are written in batches by the logwriter thread.
+        """
+        with self._pendingMutex:
+            self._pending.append((obj['video_id'], obj['action'], obj['data'], int(time.time()),))
+            full = len(self._pending) >= LOG_BATCH_SIZE and not self._failing
+        if (full):
+            self.flush()
+
+    def pending(self):
+        with self._pendingMutex:
+            return len(self._pending)
+
+    def flush(self):
+        """
+        Write queued log entries in one transaction. Entries that could not be written stay queued for the next flush.
+        """
+        with self._flushMutex:
+            with self._pendingMutex:
+                rows = self._pending
+                self._pending = []
+            if (len(rows) == 0):
+                return None
+            try:
+                with self._db.write() as cursor:
+                    cursor.executemany('INSERT INTO logs (video_id, action, data, created_at) VALUES (?, ?, ?, ?)', rows)
+            except Exception as e:
+                logger.error('Unable to write ' + str(len(rows)) + ' logs, retrying: ' + str(e))
+                self.failures += 1
+                self._retry(rows)
+                return None
+            self._failing = False
+            self.written += len(rows)
+            logger.debug('Inserted ' + str(len(rows)) + ' logs into DB')
+
+    def _retry(self, rows: list):
+        # queue rows again in front of the entries created meanwhile
+        with self._pendingMutex:
+            self._failing = True
+            self._pending = rows + self._pending
+            excess = len(self._pending) - LOG_MAX_PENDING
+            if (excess > 0):
+                del self._pending[:excess]
+                self.dropped += excess
+                logger.warning('Dropped ' + str(excess) + ' logs, too many are waiting to be written')
+
+    def prune(self):
+        """
+        Apply the retention policy (LOG_RETENTION_DAYS, LOG_MAX_PER_VIDEO). Deletes in small transactions
+        so other writers wait for one chunk at most. Returns the number of deleted logs.
+        """
+        deleted = 0
+        if (LOG_RETENTION_DAYS > 0):
+            before = int(time.time()) - LOG_RETENTION_DAYS * 86400
+            deleted += self._deleteChunks('SELECT id FROM logs WHERE created_at < ? ORDER BY created_at LIMIT ?', (before,))
+        if (LOG_MAX_PER_VIDEO > 0):
+            rows = self._db.read('SELECT video_id, COUNT(*) AS count FROM logs GROUP BY video_id HAVING count > ?', (LOG_MAX_PER_VIDEO,))
+            for row in rows:
+                deleted += self._deleteChunks('SELECT id FROM logs WHERE video_id = ? ORDER BY created_at, id LIMIT ?', (row['video_id'],), row['count'] - LOG_MAX_PER_VIDEO)
+        self.pruned += deleted
+        return deleted
+
+    def _deleteChunks(self, select: str, parameters: tuple, limit: int = None):
+        """
+        Delete the logs selected by select (its last parameter is the chunk size), at most limit logs
+        """
+        deleted = 0
+        while (limit == None or deleted < limit):
+            size = LOG_PRUNE_CHUNK
+            if (limit != None):
+                size = min(size, limit - deleted)
+            with self._db.write() as cursor:
+                cursor.execute('DELETE FROM logs WHERE id IN (' + select + ')', parameters + (size,))
+                count = cursor.rowcount
+            deleted += count
+            if (count < size):
+                break
+            time.sleep(0.01) # let waiting writers in between chunks
+        return deleted
             
     def getItems(self, videoId):
+        self.flush() # include entries that are still queued
         items = []
-        with self._mutex:
-            cursor = self._db.cursor()
-            cursor.execute('SELECT id, video_id, action, data, created_at FROM logs WHERE video_id = ? ORDER BY created_at DESC', (videoId,))
-            rows = cursor.fetchall()
-            for row in rows:
-                items.append({
-                    'id': int(row['id'] or 0),
-                    'video_id': int(row['video_id'] or 0),
-                    'action': row['action'],
-                    'data': row['data'],
-                    'created_at': int(row['created_at'] or 0),
-                })
+        rows = self._db.read('SELECT id, video_id, action, data, created_at FROM logs WHERE video_id = ? ORDER BY created_at DESC', (videoId,))
+        for row in rows:
+            items.append(self._toObject(row))
         return items
+
+    def getPage(self, videoId, limit: int = LOG_PAGE_SIZE, before: tuple = None, after: tuple = None, actions: list = None):
+        """
+        Page of logs for a video, newest first. before/after are (created_at, id) cursors of a previous page:
+        before returns older logs, after returns newer logs. Returns (items, more), more is True if there are
+        more logs past the page in the requested direction.
+        Uses the (video_id, created_at) index, sqlite appends id (the rowid) to every index so no sorting is needed.
+        """
+        self.flush()
+        limit = max(1, min(limit, LOG_MAX_PAGE_SIZE)) # validated by the caller, see namespaces/logs.py
+        where = ['video_id = ?']
+        parameters = [videoId]
+        if (before != None):
+            where.append('(created_at, id) < (?, ?)')
+            parameters += [int(before[0]), int(before[1])]
+        if (after != None):
+            where.append('(created_at, id) > (?, ?)')
+            parameters += [int(after[0]), int(after[1])]
+        if (actions):
+            where.append('action IN (' + ', '.join(['?'] * len(actions)) + ')')
+            parameters += [str(action) for action in actions]
+        # walk forward from the after cursor, otherwise backwards from the newest (or before) log
+        order = 'ASC' if (after != None and before == None) else 'DESC'
+        parameters.append(limit + 1)
+        rows = self._db.read('SELECT id, video_id, action, data, created_at FROM logs WHERE ' + ' AND '.join(where) + ' ORDER BY created_at ' + order + ', id ' + order + ' LIMIT ?', tuple(parameters))
+        more = len(rows) > limit
+        items = [self._toObject(row) for row in rows[:limit]]
+        if (order == 'ASC'):
+            items.reverse()
+        return (items, more)
+
+    def _toObject(self, row):
+        return {
+            'id': int(row['id'] or 0),
+            'video_id': int(row['video_id'] or 0),
+            'action': row['action'],
+            'data': row['data'],
+            'created_at': int(row['created_at'] or 0),
+        }
         
-log = LogModel(db, mutex, settings)
\ No newline at end of file
+log = LogModel(db, settings)
\ No newline at end of file
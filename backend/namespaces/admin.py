@@ -0,0 +1,31 @@
+"""
+ * Developed by Hutz Media Ltd. <info@hutzmedia.com>
+ * Copyright 2026-10-18
+ * See README.md
+"""
+
+import server
+import metrics
+
+import logging
+logger = logging.getLogger('piworkout-server')
+
+def receive(event, queue):
+    """
+    Server diagnostics
+    """
+    if (event['action'] == 'latency'):
+        # handler latency per namespace/action
+        server.send(queue, {
+            'namespace': 'admin',
+            'action': 'latency',
+            'latency': metrics.latencyReport(),
+        })
+    elif (event['action'] == 'resetLatency'):
+        metrics.resetLatency()
+        server.send(queue, {
+            'namespace': 'admin',
+            'action': 'resetLatency',
+        })
+    elif (event['action'] == 'logLatency'):
+        metrics.logLatency()
@@ -15,12 +15,11 @@ from threads import listfetch
 import json
 import os
 #import google.oauth2.credentials
-import google_auth_oauthlib.flow
-
 import logging
 logger = logging.getLogger('piworkout-server')
 
 def receive(event, queue):
+    import google_auth_oauthlib.flow # slow to import, only needed when connecting an account
     logger.info('connect.receive()', event)
     if (event['method'] == 'GET' and event['action'] == 'authorizationUrl'):
         authorization_url = None
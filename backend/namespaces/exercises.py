@@ -16,14 +16,15 @@ def binaryReceive(message, queue):
     
     I = struct.Struct('<I') # unsigned 4 bytes integer little-endian
     
-    uuid = message[44:80].decode('ascii').rstrip('\x00')
-    #action = message[80:88].decode('ascii').rstrip('\x00')
-    exerciseId = I.unpack(message[88:92])[0]
-    length = I.unpack(message[92:96])[0]
+    view = memoryview(message)
+    uuid = bytes(view[44:80]).decode('ascii').rstrip('\x00')
+    #action = bytes(view[80:88]).decode('ascii').rstrip('\x00')
+    exerciseId = I.unpack(view[88:92])[0]
+    length = I.unpack(view[92:96])[0]
     
     path = './images/exercises/' + str(exerciseId) + '.jpg'
     
-    fp = open(path, 'wb')
-    buffer = message[96:(length + 96)]
+    buffer = view[96:(length + 96)]
     print('Saving exercise image ' + str(len(buffer)) + ' bytes')
-    fp.write(buffer)
\ No newline at end of file
+    with open(path, 'wb') as fp:
+        fp.write(buffer)
\ No newline at end of file
@@ -6,77 +6,396 @@
 
 import struct
 import os
-import ffmpeg
 import threading
 import re
-import ffmpeg
 import tempfile
 import time
 import subprocess
-from PIL import Image
+import json
+import hashlib
 
 import server
 import model
 from namespaces import videos
+from threads import filewriter
 
 import logging
 logger = logging.getLogger('piworkout-server')
 
-fp = None
-cUuid = ''
+# binary upload protocol (after the 88 byte header, see codec.py)
+#   store: 4 bytes (uint) part, 4 bytes (uint) start, 4 bytes (uint) length, 8 bytes (uint64) total, n bytes data
+#          start is the byte offset of the chunk modulo 2^32, see resolveOffset()
+#   cmpt:  4 bytes (uint) name length, n bytes name,
+#          optional: 8 bytes (string) hashlib algorithm (e.g. sha256), 4 bytes (uint) digest length, n bytes digest
+#   stat:  no payload, replies with the ack for the upload so an interrupted upload can continue
+# every written chunk is acknowledged with {namespace: 'file-upload', action: 'ack', uuid, total, received, ranges}
+# received is the number of bytes written from the start of the file, ranges are all written [start, end) ranges
+SESSIONS = {} # uuid => UploadSession
+sessionsMutex = threading.Lock()
+STATE_INTERVAL = 2 # seconds between saving session state to disk
+SESSION_TTL = int(os.getenv('UPLOAD_SESSION_TTL', str(24 * 60 * 60))) # seconds without a chunk before an unfinished upload is deleted
+SWEEP_INTERVAL = 10 * 60 # seconds between checks for abandoned uploads
+_partialRe = re.compile(r'^\.([\w-]+)\.(?:video|upload|upload\.tmp)$') # files of an unfinished upload in /videos
+I = struct.Struct('<I') # unsigned 4 bytes integer little-endian
+Q = struct.Struct('<Q') # unsigned 8 bytes long little-endian
+
+class UploadSession:
+    """
+    A single upload. Chunks are written at their offset so they can arrive in any order and from several connections.
+    State is saved next to the file so an upload can continue after a disconnect or restart.
+    """
+
+    def __init__(self, uuid: str, total: int):
+        self.uuid = uuid
+        self.total = total
+        self.path = '/videos/.' + uuid + '.video'
+        self.statePath = '/videos/.' + uuid + '.upload'
+        self.ranges = [] # written [start, end) ranges, sorted and merged
+        self.completed = False
+        self.started = time.time()
+        self.updated = self.started # last chunk written
+        self.bytes = 0 # bytes received by this process
+        self._fd = None
+        self._savedAt = 0
+        self._mutex = threading.Lock()
+
+    @staticmethod
+    def load(uuid: str):
+        """
+        Load session saved by a previous connection or process. Returns None if there is none.
+        """
+        session = UploadSession(uuid, 0)
+        try:
+            with open(session.statePath, 'r') as fp:
+                data = json.load(fp)
+            session.total = int(data['total'])
+            session.ranges = [[int(start), int(end)] for start, end in data['ranges']]
+        except (OSError, ValueError, KeyError, TypeError):
+            return None
+        if (not os.path.exists(session.path)):
+            return None
+        return session
+
+    def write(self, offset: int, data):
+        """
+        Write chunk at offset (filewriter thread). Returns False if the upload has already been completed.
+        """
+        with self._mutex:
+            if (self.completed):
+                # late chunk, e.g. from a second connection, the file is being verified and moved
+                return False
+            self.updated = time.time()
+            if (self._fd == None):
+                self._fd = os.open(self.path, os.O_WRONLY | os.O_CREAT, 0o644)
+            fd = self._fd
+        view = memoryview(data)
+        position = offset
+        while (len(view) > 0):
+            written = os.pwrite(fd, view, position)
+            view = view[written:]
+            position += written
+        with self._mutex:
+            self._addRange(offset, position)
+            self.bytes += position - offset
+        if (time.time() - self._savedAt >= STATE_INTERVAL):
+            self.save()
+        return True
+
+    def _addRange(self, start: int, end: int):
+        ranges = []
+        for item in self.ranges:
+            if (item[1] < start or item[0] > end):
+                ranges.append(item)
+            else:
+                # overlapping or adjacent
+                start = min(start, item[0])
+                end = max(end, item[1])
+        ranges.append([start, end])
+        ranges.sort()
+        self.ranges = ranges
+
+    def received(self):
+        """
+        Number of bytes written from the start of the file
+        """
+        with self._mutex:
+            if (len(self.ranges) > 0 and self.ranges[0][0] == 0):
+                return self.ranges[0][1]
+        return 0
+
+    def isComplete(self):
+        return self.received() >= self.total
+
+    def save(self):
+        """
+        Save state (filewriter thread). Data is flushed first so saved ranges are on disk.
+        """
+        with self._mutex:
+            fd = self._fd
+            data = {
+                'uuid': self.uuid,
+                'total': self.total,
+                'ranges': [list(item) for item in self.ranges],
+            }
+        if (fd != None):
+            os.fdatasync(fd)
+        tmpPath = self.statePath + '.tmp'
+        with open(tmpPath, 'w') as fp:
+            json.dump(data, fp)
+        os.replace(tmpPath, self.statePath)
+        self._savedAt = time.time()
+
+    def close(self):
+        with self._mutex:
+            fd = self._fd
+            self._fd = None
+        if (fd != None):
+            os.close(fd)
+
+    def complete(self):
+        """
+        Stop accepting chunks and close the file (filewriter thread)
+        """
+        with self._mutex:
+            self.completed = True
+        self.close()
+
+    def delete(self):
+        """
+        Close and delete the partial file and its state
+        """
+        self.close()
+        for path in (self.path, self.statePath, self.statePath + '.tmp'):
+            if (os.path.exists(path)):
+                os.remove(path)
+
+    def toObject(self):
+        with self._mutex:
+            ranges = [list(item) for item in self.ranges]
+        return {
+            'namespace': 'file-upload',
+            'action': 'ack',
+            'uuid': self.uuid,
+            'total': self.total,
+            'received': ranges[0][1] if (len(ranges) > 0 and ranges[0][0] == 0) else 0,
+            'ranges': ranges,
+        }
+
+def getSession(uuid: str, total: int = None):
+    """
+    Get upload session, continue a saved session or start a new one if total is specified
+    """
+    with sessionsMutex:
+        session = SESSIONS.get(uuid)
+        if (session == None):
+            session = UploadSession.load(uuid)
+            if (session != None):
+                logger.info('Continuing upload ' + uuid + ' received=' + str(session.received()) + '/' + str(session.total))
+            elif (total != None):
+                session = UploadSession(uuid, total)
+                if (os.path.exists(session.path)):
+                    # left over from an upload without saved state
+                    os.remove(session.path)
+            else:
+                return None
+            SESSIONS[uuid] = session
+        return session
+
+def resolveOffset(part: int, start: int, length: int, total: int):
+    """
+    Byte offset of a chunk. start is only 32 bits so for files larger than 4 GB the offset is the value
+    start + k * 2^32 closest to where the part is expected (fixed size chunks, the last chunk ends at total).
+    """
+    if (total < 2 ** 32):
+        return start
+    if (length < total and (total - length) % (2 ** 32) == start):
+        # last chunk
+        return total - length
+    expected = part * length
+    k = round((expected - start) / (2 ** 32))
+    return start + max(0, k) * (2 ** 32)
+
+def sendAck(queue, session):
+    server.send(queue, session.toObject(), key='upload:' + session.uuid) # only the newest ack is kept for slow clients
+
+def writeChunk(queue, session, offset, data):
+    # filewriter thread
+    if (not session.write(offset, data)):
+        logger.debug('Upload ' + session.uuid + ' is complete, ignoring chunk at offset=' + str(offset))
+        return None
+    sendAck(queue, session)
+
+def sweepSessions():
+    """
+    Delete uploads that received no chunk for SESSION_TTL seconds (filewriter thread, no chunk is being written).
+    Runs with sessionsMutex held so an upload is not continued while its files are deleted.
+    """
+    now = time.time()
+    with sessionsMutex:
+        for session in list(SESSIONS.values()):
+            if (not session.completed and now - session.updated >= SESSION_TTL):
+                logger.info('Deleting abandoned upload ' + session.uuid + ' received=' + str(session.received()) + '/' + str(session.total))
+                SESSIONS.pop(session.uuid, None)
+                session.delete()
+        # files of uploads that were not continued since a restart
+        try:
+            names = os.listdir('/videos')
+        except OSError:
+            return None
+        for name in names:
+            match = _partialRe.match(name)
+            if (match == None or match.group(1) in SESSIONS):
+                continue
+            path = '/videos/' + name
+            try:
+                if (now - os.path.getmtime(path) >= SESSION_TTL):
+                    logger.info('Deleting abandoned upload file ' + path)
+                    os.remove(path)
+            except OSError:
+                pass
+
+filewriter.every(SWEEP_INTERVAL, sweepSessions)
 
 def binaryReceive(message, queue):
     """
-    Handle file uploads from desktop client
+    Handle file uploads from desktop client.
+    Runs on the event loop, chunks are written by the filewriter thread.
     """
-    global fp, cUuid
-    
-    I = struct.Struct('<I') # unsigned 4 bytes integer little-endian
-    #Q = struct.Struct('<Q') # unsigned 8 bytes long little-endian
-    
-    uuid = message[44:80].decode('ascii').rstrip('\x00')
-    action = message[80:88].decode('ascii').rstrip('\x00')
-    
-    path = '/videos/.' + uuid + '.video'
+    view = memoryview(message) # slices of a memoryview do not copy the chunk
+    uuid = bytes(view[44:80]).decode('ascii').rstrip('\x00')
+    action = bytes(view[80:88]).decode('ascii').rstrip('\x00')
     
     if (action == 'cmpt'):
         # complete
-        cUuid = ''
-        fp.close()
-        strLen = I.unpack(message[88:92])[0]
-        videoName = message[92:(92 + strLen)].decode('ascii').rstrip('\x00')
+        strLen = I.unpack(view[88:92])[0]
+        videoName = bytes(view[92:(92 + strLen)]).decode('ascii').rstrip('\x00')
+        algorithm = None
+        digest = None
+        trailer = 92 + strLen
+        if (len(view) >= trailer + 12):
+            algorithm = bytes(view[trailer:(trailer + 8)]).decode('ascii').rstrip('\x00')
+            digestLen = I.unpack(view[(trailer + 8):(trailer + 12)])[0]
+            digest = bytes(view[(trailer + 12):(trailer + 12 + digestLen)])
+        session = getSession(uuid)
+        if (session == None):
+            logger.warning('Upload ' + uuid + ' completed without any data.')
+            return None
         
-        t = threading.Thread(target=threadCreateVideo, args=(videoName, uuid))
-        t.start()
+        # create video once every chunk has been written
+        filewriter.submit(completeUpload, queue, session, videoName, algorithm, digest)
+        return None
+    elif (action == 'stat'):
+        session = getSession(uuid)
+        if (session == None):
+            server.send(queue, {
+                'namespace': 'file-upload',
+                'action': 'ack',
+                'uuid': uuid,
+                'total': 0,
+                'received': 0,
+                'ranges': [],
+            })
+            return None
+        # reply after chunks that are waiting to be written
+        filewriter.submit(sendAck, queue, session)
         return None
-        
     elif (action != 'store'):
         logger.error('Unhandled action = ' + action)
+        return None
     
-    
-    part = I.unpack(message[88:92])[0]
-    #start = I.unpack(message[92:96])[0]
-    length = I.unpack(message[96:100])[0]
-    #total = Q.unpack(message[100:108])[0]
+    part = I.unpack(view[88:92])[0]
+    start = I.unpack(view[92:96])[0]
+    length = I.unpack(view[96:100])[0]
+    total = Q.unpack(view[100:108])[0]
     
     logger.debug('file_upload len=' + str(len(message)) + ', action=' + action + ', part=' + str(part))
     
-    #print(part, start, length, total)
-    
-    if (uuid != cUuid):
-        # starting new upload
-        fp = open(path, 'wb')
-        cUuid = uuid
-    
-    buffer = message[108:(length + 108)]
-    #print('writting ' + str(len(buffer)) + ' bytes')
-    fp.write(buffer)    
+    session = getSession(uuid, total)
+    if (session.completed):
+        return None
+    offset = resolveOffset(part, start, length, session.total)
+    if (offset + length > session.total):
+        logger.warning(f'Upload {uuid} chunk part={part} offset={offset} length={length} is past the end of the file ({session.total}).')
+        return None
+    filewriter.submit(writeChunk, queue, session, offset, view[108:(length + 108)], size=length)
 
+def completeUpload(queue, session, videoName, algorithm, digest):
+    # filewriter thread, every chunk received before cmpt has been written
+    if (session.completed):
+        return None
+    if (not session.isComplete()):
+        logger.warning('Upload ' + session.uuid + ' is incomplete received=' + str(session.received()) + '/' + str(session.total))
+        obj = session.toObject()
+        obj['action'] = 'incomplete'
+        server.send(queue, obj)
+        return None
+    session.complete()
+    elapsed = time.time() - session.started
+    if (elapsed > 0):
+        logger.info(f'Upload received {session.bytes} bytes in {elapsed:.1f}s ({session.bytes / elapsed / 1024 / 1024:.1f} MB/s)')
+    t = threading.Thread(target=threadVerifyUpload, args=(queue, session, videoName, algorithm, digest))
+    t.start()
+
+def threadVerifyUpload(queue, session, videoName, algorithm, digest):
+    """
+    Check length and checksum before creating the video.
+    The completed session stays in SESSIONS until the video is created so late chunks find it and are rejected.
+    """
+    try:
+        verifyUpload(queue, session, videoName, algorithm, digest)
+    finally:
+        with sessionsMutex:
+            SESSIONS.pop(session.uuid, None)
+
+def verifyUpload(queue, session, videoName, algorithm, digest):
+    size = os.path.getsize(session.path)
+    error = None
+    if (size != session.total):
+        error = f'size {size} does not match {session.total}'
+    elif (algorithm):
+        try:
+            hasher = hashlib.new(algorithm)
+        except ValueError:
+            hasher = None
+            error = 'unknown checksum algorithm ' + algorithm
+        if (hasher != None):
+            with open(session.path, 'rb') as fp:
+                while True:
+                    buffer = fp.read(1024 * 1024)
+                    if (not buffer):
+                        break
+                    hasher.update(buffer)
+            if (hasher.digest() != digest):
+                error = algorithm + ' checksum does not match'
+
+    if (os.path.exists(session.statePath)):
+        os.remove(session.statePath)
+    if (error != None):
+        logger.error('Upload ' + session.uuid + ' failed: ' + error)
+        os.remove(session.path)
+        server.send(queue, {
+            'namespace': 'file-upload',
+            'action': 'error',
+            'uuid': session.uuid,
+            'error': error,
+        })
+        return None
+
+    server.send(queue, {
+        'namespace': 'file-upload',
+        'action': 'complete',
+        'uuid': session.uuid,
+    })
+    threadCreateVideo(videoName, session.uuid)
 
 def threadCreateVideo(videoName, uuid):
     """
     Create video and convert to correct format
     """
+    # only needed for uploads, not imported at startup
+    import ffmpeg
+    from PIL import Image
+
     # get information about video
     path = '/videos/.' + uuid + '.video'
     logger.info(path)
@@ -125,7 +444,6 @@ def threadCreateVideo(videoName, uuid):
     )
     
     model.video.insert(video)
-    model.video.save(video)
     
     newPath = '/videos/' + str(video.id) + '-upload-' + video.filename
     
@@ -155,6 +473,7 @@ def threadCreateVideo(videoName, uuid):
     try:
         video.progress = model.VideoProgress()
         video.progress.totalBytes = video.filesize
+        model.video.touch()
         
         with ProgressFfmpeg(duration, on_progress, video) as progress:
             #-vcodec libx264 -acodec aac
@@ -172,6 +491,7 @@ def threadCreateVideo(videoName, uuid):
         video.status = model.STATUS_COMPLETE
         video.progress = None
         model.video.save(video, lock=False)
+    model.video.flush()
         
     videos.broadcast()
     
@@ -318,13 +638,14 @@ def on_progress(progress, video):
     logger.debug('encoding progress =' + str(progress))
     with model.video.dataMutex():
         video.progress.progress = progress
+        model.video.touch()
         
     # send progress to all clients
     server.broadcast({
         'namespace': 'videos',
         'video': video.toObject(),
         'source': 'fileUpload',
-    })
+    }, key='progress:' + str(video.id)) # only the newest progress for a video is kept for slow clients
     
 ## --------------------------- FFMpeg Progres ---------------------------
 class ProgressFfmpeg(threading.Thread):
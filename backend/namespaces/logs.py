@@ -11,10 +11,17 @@ import model, server
 import logging
 logger = logging.getLogger('piworkout-server')
 
+PAGING_KEYS = ('limit', 'before', 'after', 'actions', 'stream')
+STREAM_MAX_QUEUED = 1024 * 1024 # bytes, a stream pauses after queuing this much for the client
+MAX_ACTIONS = 20 # action filters per request
+
 def receive(event, queue):
     logger.debug('logs event=' + json.dumps(event))
     
     if ('method' in event and event['method'] == 'GET'):
+        if (any(key in event for key in PAGING_KEYS)):
+            sendPages(event, queue)
+            return None
         # load all logs for videoId
         server.send(queue, {
             'namespace': 'logs',
@@ -26,4 +33,104 @@ def receive(event, queue):
             'video_id': event['videoId'],
             'action': event['action'],
             'data': event['data'],
-        })
\ No newline at end of file
+        })
+
+def parseCursor(value):
+    """
+    Cursor from a client, {created_at, id} or [created_at, id]. Raises ValueError if it is malformed.
+    """
+    if (value == None):
+        return None
+    try:
+        if (isinstance(value, dict)):
+            return (int(value['created_at']), int(value['id']))
+        if (isinstance(value, (list, tuple)) and len(value) == 2):
+            return (int(value[0]), int(value[1]))
+    except (KeyError, TypeError, ValueError):
+        pass
+    raise ValueError('invalid cursor')
+
+def parseLimit(value):
+    """
+    Page size from a client clamped to 1..LOG_MAX_PAGE_SIZE. Raises ValueError if it is not a number.
+    """
+    if (value == None):
+        return model.LOG_PAGE_SIZE
+    try:
+        return max(1, min(int(value), model.LOG_MAX_PAGE_SIZE))
+    except (TypeError, ValueError):
+        raise ValueError('invalid limit')
+
+def parseActions(value):
+    if (value == None):
+        return None
+    if (not isinstance(value, list) or not all(isinstance(action, str) for action in value)):
+        raise ValueError('invalid actions')
+    return value[:MAX_ACTIONS]
+
+def cursor(item):
+    if (item == None):
+        return None
+    return {'created_at': item['created_at'], 'id': item['id']}
+
+def sendError(event, queue, error):
+    obj = {
+        'namespace': 'logs',
+        'action': 'error',
+        'error': error,
+    }
+    if ('uuid' in event):
+        obj['uuid'] = event['uuid']
+    server.send(queue, obj)
+
+def sendPages(event, queue):
+    """
+    Paginated GET
+      request  {namespace: 'logs', method: 'GET', videoId, limit?, before?, after?, actions?: [...], stream?: bool, uuid?}
+      response {namespace: 'logs', videoId, items, before, after, more, uuid?}
+      error    {namespace: 'logs', action: 'error', error, uuid?}
+    items are newest first. Pass before (the oldest item) to get the next older page, after (the newest item)
+    to get logs added since. With stream every page is sent as a separate message until the last one (done=True).
+    A stream never waits for a slow client: once STREAM_MAX_QUEUED bytes are queued for the client it stops with paused=True,
+    the client continues by sending the request again with the page's before (or after) cursor when it has received the page.
+    """
+    try:
+        videoId = int(event['videoId'])
+        limit = parseLimit(event.get('limit'))
+        before = parseCursor(event.get('before'))
+        after = parseCursor(event.get('after'))
+        actions = parseActions(event.get('actions'))
+    except (KeyError, TypeError, ValueError) as e:
+        logger.warning('Invalid logs request: ' + str(e))
+        sendError(event, queue, str(e))
+        return None
+    stream = bool(event.get('stream', False))
+    forward = (after != None and before == None)
+    # bytes queued for the client, counted here because the channel only sees a put once the event loop runs it
+    queued = queue.size()
+
+    while (True):
+        items, more = model.log.getPage(videoId, limit=limit, before=before, after=after, actions=actions)
+        obj = {
+            'namespace': 'logs',
+            'videoId': videoId,
+            'items': items,
+            'before': cursor(items[-1] if len(items) > 0 else None),
+            'after': cursor(items[0] if len(items) > 0 else None),
+            'more': more,
+        }
+        if ('uuid' in event):
+            obj['uuid'] = event['uuid']
+        paused = stream and more and queued >= STREAM_MAX_QUEUED
+        if (stream):
+            obj['stream'] = True
+            obj['done'] = not more
+            obj['paused'] = paused
+        queued += server.send(queue, obj)
+        if (not stream or not more or paused or queue.closed):
+            return None
+        # continue in the same direction
+        if (forward):
+            after = parseCursor(obj['after'])
+        else:
+            before = parseCursor(obj['before'])
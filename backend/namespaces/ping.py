@@ -5,16 +5,46 @@
 """
 
 import server
+import clocksync
 
 import logging
 logger = logging.getLogger('piworkout-server')
 
 def receive(event, queue):
     """
-    Send a simple reply with same uuid provided so that a client knows how long it takes the server to respond over the network
+    Send a simple reply with same uuid provided so that a client knows how long it takes the server to respond over the network.
+    If the client sends t0 the reply carries server timestamps for clock synchronization, see clocksync.py.
     """
+    t1 = clocksync.now()
     #logger.debug('ping', event)
-    server.send(queue, {
+    reply = {
         'namespace': 'ping',
         'uuid': event['uuid'],
-    })
+    }
+    if ('t0' in event):
+        # completed samples from previous pings
+        samples = []
+        for sample in (event.get('samples') or [])[-clocksync.SAMPLES:]:
+            try:
+                samples.append(tuple(float(value) for value in sample))
+            except (TypeError, ValueError):
+                continue
+        if (len(samples) > 0):
+            clock = clocksync.estimate(queue)
+            # oldest first, samples the client sent before are ignored by add()
+            for t0, st1, st2, t3 in sorted(sample for sample in samples if len(sample) == 4):
+                clock.add(t0, st1, st2, t3)
+        if (queue.clock != None and queue.clock.offset != None):
+            # server's estimate, clients can compare with their own
+            reply['offset'] = queue.clock.offset
+            reply['rtt'] = queue.clock.rtt
+        reply['t0'] = event['t0']
+        reply['t1'] = t1
+        reply['t2'] = t1
+        # t2 is taken when the reply is written to the socket, time spent queued behind other messages is not network delay
+        server.send(queue, reply, prepare=stampTransmit)
+        return None
+    server.send(queue, reply)
+
+def stampTransmit(reply):
+    reply['t2'] = clocksync.now()
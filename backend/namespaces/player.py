@@ -8,6 +8,7 @@ import time
 import json
 
 import model, server
+import clocksync
 from threads import listfetch
 
 import logging
@@ -18,16 +19,28 @@ STATUS_PAUSED = 2
 STATUS_PLAYING = 3
 STATUS_ENDED = 4
 
+PLAY_LEAD = 100 # ms, followers are told to start playing this long after the play command plus half the slowest client's rtt
+RESYNC_THRESHOLD = 0.5 # seconds, controller progress further than this from the timeline (buffering, stalls) moves the timeline
+DRIFT_THRESHOLD = 0.25 # seconds, followers further than this from the timeline are sent a correction
+
 class PlayerModel:
-    time:float = 0
+    """
+    Authoritative playback timeline. While playing the position at server time t is
+    time + (t - serverTime) / 1000 * rate, clients compute the position locally and only state changes are broadcast.
+    """
+    time:float = 0 # position (seconds) at serverTime
+    serverTime:float = 0 # server time (clocksync.now()) at which the player was at time
+    rate:float = 1.0 # playback rate
     videoId:int = 0
     status:int = 0
     client:str = '' # this client has control over the player, it will instruct other clients to play, pause, seek, etc
+    controller = None # channel id of the controlling client, progress from other clients is checked for drift. Cleared when that channel closes.
     action:str = ''
     
     #
     video = None
     lastWatched:int = 0
+    version:int = 0 # changes every time the player changes, see model.nextVersion()
     
     def toString(self):
         return f'time={self.time},videoId={self.videoId},status={self.status},action={self.action}'
@@ -35,12 +48,26 @@ class PlayerModel:
     def toObject(self):
         return {
             'time': self.time,
+            'serverTime': self.serverTime,
+            'rate': self.rate,
             'videoId': self.videoId,
             'status': self.status,
             'client': self.client,
             'action': self.action,
         }
 
+    def position(self, serverTime: float):
+        """
+        Position of the timeline at serverTime
+        """
+        if (self.status != STATUS_PLAYING):
+            return self.time
+        return self.time + (serverTime - self.serverTime) / 1000 * self.rate
+
+    def anchor(self, position: float, serverTime: float):
+        self.time = position
+        self.serverTime = serverTime
+
 MODEL = PlayerModel()
 
 def data():
@@ -49,8 +76,17 @@ def data():
 def receive(event, queue):
     logger.debug('player event=' + json.dumps(event))
     if (event['action']):
-        MODEL.action = event['action']
-        
+        serverTime = eventServerTime(event, queue)
+        playAt = None
+
+        if (event['action'] == 'progress' and MODEL.controller == None and MODEL.status == STATUS_PLAYING):
+            # the controller disconnected (e.g. reconnected with a new channel), the first client still playing takes over
+            MODEL.controller = queue.id
+        if (event['action'] == 'progress' and MODEL.controller != None and MODEL.controller != queue.id):
+            # follower reporting its position, the timeline is not changed
+            checkDrift(event, queue, serverTime)
+            return None
+
         if (MODEL.video == None or MODEL.video.id != event['videoId']):
             # mark last video position before changing video
             if (MODEL.video != None):
@@ -62,39 +98,114 @@ def receive(event, queue):
                 logger.warning('Error: Video not found.')
                 return
         
-        if (event['action'] == 'progress' or event['action'] == 'seek'):
-            MODEL.time = event['time']
+        if (event['action'] == 'progress'):
             if (time.time() - MODEL.lastWatched >= 10):
                 # 10 seconds have passed
                 savePosition(event, updateDB=True, updateYT=True)
-            elif (event['action'] == 'seek'):
+            rate = float(event.get('rate') or MODEL.rate)
+            if (abs(event['time'] - MODEL.position(serverTime)) <= RESYNC_THRESHOLD and rate == MODEL.rate):
+                # controller is on the timeline, nothing to tell other clients
+                return None
+            # controller stalled or changed rate, move the timeline
+            MODEL.rate = rate
+            MODEL.anchor(event['time'], serverTime)
+        elif (event['action'] == 'seek'):
+            MODEL.anchor(event['time'], serverTime)
+            if (time.time() - MODEL.lastWatched >= 10):
+                # 10 seconds have passed
+                savePosition(event, updateDB=True, updateYT=True)
+            else:
                 # just update position in memory
                 savePosition(event, updateDB=False, updateYT=False)
         elif (event['action'] == 'play'):
             MODEL.client = event['source']
+            MODEL.controller = queue.id
             MODEL.status = STATUS_PLAYING
             MODEL.videoId = event['videoId']
-            MODEL.time = event['time']
+            MODEL.rate = float(event.get('rate') or 1.0)
+            MODEL.anchor(event['time'], serverTime)
+            playAt = playAtTime(event)
         elif (event['action'] == 'pause'):
             savePosition(event, updateYT=True)
             MODEL.client = ''
             MODEL.status = STATUS_PAUSED
-            MODEL.time = event['time']
+            MODEL.anchor(event['time'], serverTime)
         elif (event['action'] == 'ended'):
             savePosition(event, updateYT=True)
             MODEL.client = ''
+            MODEL.controller = None
             MODEL.status = STATUS_ENDED
         elif (event['action'] == 'stop'):
             savePosition(event, updateYT=True)
             MODEL.client = ''
+            MODEL.controller = None
             MODEL.status = STATUS_STOPPED
-            MODEL.time = event['time']
+            MODEL.anchor(event['time'], serverTime)
             
+        # action is only changed together with the version, the cached init message must not serve a stale action
+        MODEL.action = event['action']
+        MODEL.version = model.nextVersion()
+
         # broadcast player status to all other clients
-        server.broadcast({
+        message = {
             'namespace': 'player',
             'player': data(),
-        }, queue)
+        }
+        if (playAt != None):
+            # followers start at server time playAt from position time + (playAt - serverTime) / 1000
+            message['playAt'] = playAt
+        server.broadcast(message, queue)
+
+def disconnected(queue):
+    """
+    Release control of the player when the controlling client's channel closes
+    """
+    if (MODEL.controller == queue.id):
+        logger.debug(f'player controller client={queue.id} disconnected')
+        MODEL.controller = None
+
+def checkDrift(event, queue, serverTime):
+    """
+    Send a correction to a follower that is too far from the timeline
+    """
+    if (MODEL.videoId != event.get('videoId')):
+        return None
+    drift = event['time'] - MODEL.position(serverTime)
+    if (abs(drift) <= DRIFT_THRESHOLD):
+        return None
+    logger.debug(f'player follower drift={drift:.3f}s client={queue.id}')
+    server.send(queue, {
+        'namespace': 'player',
+        'action': 'correct',
+        'drift': drift, # seconds, positive when the follower is ahead
+        'player': data(),
+    })
+
+def eventServerTime(event, queue):
+    """
+    Server time the client sampled event['time']. Uses event['clientTime'] if the client's clock is synchronized.
+    """
+    if ('clientTime' in event and queue.clock != None):
+        try:
+            serverTime = queue.clock.toServerTime(float(event['clientTime']))
+        except (TypeError, ValueError):
+            serverTime = None
+        if (serverTime != None):
+            return serverTime
+    return clocksync.now()
+
+def playAtTime(event):
+    """
+    Server time followers should start playing. The controlling client can choose with event['playAt'].
+    """
+    if (event.get('playAt') != None):
+        try:
+            return float(event['playAt'])
+        except (TypeError, ValueError):
+            pass
+    with server.clientsMutex:
+        clients = list(server.CLIENTS)
+    return clocksync.now() + PLAY_LEAD + clocksync.maxRtt(clients) / 2
 
 def savePosition(event, updateDB = True, updateYT = True):
     if (MODEL.video != None):
@@ -109,6 +220,8 @@ def savePosition(event, updateDB = True, updateYT = True):
                 MODEL.video.position = MODEL.video.duration
             if (updateDB):
                 model.video.save(MODEL.video, False)
+            else:
+                model.video.touch()
         # set watched position in youtube
         if (updateYT):
             markWatched()
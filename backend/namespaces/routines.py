@@ -21,6 +21,8 @@ def receive(event, queue):
                     exercisePut(event, queue)
                 elif (event['method'] == 'GET'):
                     exerciseGet(event, queue)
+                elif (event['method'] == 'ORDER'):
+                    exerciseOrder(event, queue)
             pass
         else:
             # List of Routines
@@ -31,6 +33,8 @@ def receive(event, queue):
                     routinePut(event, queue)
                 elif (event['method'] == 'GET'):
                     routineGet(event, queue)
+                elif (event['method'] == 'ORDER'):
+                    routineOrder(event, queue)
 
 def routineDelete(event, queue):
     routine = model.routines.byId(int(event['id']))
@@ -60,13 +64,21 @@ def routinePut(event, queue):
     routine.order = int(data['order'] or routine.order)
     routine.name = str(data['name'] or routine.name)
     routine.description = str(data['description'] or routine.description)
-    routine.exercises = []
+    if (routine.exercises == None):
+        routine.exercises = []
     
     model.routines.save(routine=routine)
     
     # update all clients
     broadcast()
     
+def routineOrder(event, queue):
+    # event['ids'] lists routine ids in their new order, saved in one transaction
+    model.routines.reorder([int(id) for id in event['ids']])
+    
+    # update all clients
+    broadcast()
+    
 def routineGet(event, queue):
     routine = None
     if (event['id']):
@@ -92,16 +104,12 @@ def exerciseDelete(event, queue):
         logger.warning('Routine not found.')
         return
     
-    exercise = None
-    for item in routine.exercises:
-        if (int(item.id) == int(event['exerciseId'])):
-            exercise = item
-            break
+    exercise = model.routines.exerciseById(routine, int(event['exerciseId']))
             
     if (exercise == None):
         logger.warning('Exercise not found in routine.')
         return
-    routine.removeExercise(routine, exercise)
+    model.routines.removeExercise(routine, exercise)
         
 def exercisePut(event, queue):
     routine = model.routines.byId(int(event['routineId']))
@@ -109,11 +117,7 @@ def exercisePut(event, queue):
         logger.warning('Routine not found.')
         return
     
-    exercise = None
-    for item in routine.exercises:
-        if (int(item.id) == int(event['exerciseId'])):
-            exercise = item
-            break
+    exercise = model.routines.exerciseById(routine, int(event['exerciseId']))
     
     if (exercise == None):
         # create new exercise
@@ -133,17 +137,25 @@ def exercisePut(event, queue):
     # update all clients
     broadcast()
     
+def exerciseOrder(event, queue):
+    # event['ids'] lists exercise ids of the routine in their new order, saved in one transaction
+    routine = model.routines.byId(int(event['routineId']))
+    if (routine == None):
+        logger.warning('Routine not found.')
+        return
+    
+    model.routines.reorderExercises(routine, [int(id) for id in event['ids']])
+    
+    # update all clients
+    broadcast()
+    
 def exerciseGet(event, queue):
     routine = model.routines.byId(int(event['routineId']))
     if (routine == None):
         logger.warning('Routine not found.')
         return
     
-    exercise = None
-    for item in routine.exercises:
-        if (int(item.id) == int(event['exerciseId'])):
-            exercise = item
-            break
+    exercise = model.routines.exerciseById(routine, int(event['exerciseId']))
         
     if (exercise == None):
         # entire list
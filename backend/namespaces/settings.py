@@ -8,7 +8,6 @@ import model
 import datetime
 import math
 import http.cookiejar as cookielib
-import yt_dlp
 import sys
 import os
 
@@ -97,6 +96,7 @@ def receive(event, queue):
     elif (event['method'] == 'GET'):
         if (event['action'] == 'update-yt-dlp'):
             logger.info('updating yt-dlp')
+            import yt_dlp
             with yt_dlp.YoutubeDL() as ydl:
                 yt_dlp.Updater(ydl).update()
             # restart server
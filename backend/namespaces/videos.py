@@ -5,10 +5,11 @@
 """
 
 import urllib.parse
-from googleapiclient.errors import HttpError
 import time
 import requests
 import json
+import threading
+from collections import deque
 from urllib.parse import urlparse, parse_qs
 from contextlib import suppress
 
@@ -18,13 +19,33 @@ import model, server
 import logging
 logger = logging.getLogger('piworkout-server')
 
+# delta protocol
+# clients that send {'namespace': 'videos', 'action': 'subscribe', 'version': n} receive
+# {'namespace': 'videos', 'action': 'delta', 'version': n, 'ops': [...]} instead of the full list.
+# ops are applied in order:
+#   {'op': 'remove', 'id': id}
+#   {'op': 'update', 'id': id, 'fields': {...}} only the fields that changed
+#   {'op': 'insert', 'index': i, 'video': {...}}
+#   {'op': 'move', 'id': id, 'index': i} remove video from list and insert at index
+VERSION = 0 # version of the video list, incremented every time a delta is broadcast
+HISTORY_SIZE = 64 # number of deltas kept to catch up clients, older clients receive a snapshot
+history = deque(maxlen=HISTORY_SIZE) # (version, ops)
+snapshotIds = [] # order of video ids in last broadcast
+snapshotObjects = {} # id => video object in last broadcast
+deltaMutex = threading.Lock()
+
 def receive(event, queue):
     logger.info('videos', event)
     if (event['action']):
         if (event['action'] == 'refresh'):
             # Update all clients with full video list
             broadcast()
+            if ('videosDelta' in queue.capabilities):
+                sendSnapshot(queue)
             listfetch.fetchOnNextCycle()
+        elif (event['action'] == 'subscribe'):
+            # Switch client to delta updates
+            subscribe(event, queue)
         elif (event['action'] == 'order'):
             # Change order of videos
             changeOrder(event, queue)
@@ -150,6 +171,7 @@ def remove(event, queue):
                 logger.error('  error removing video from youtube playlist api')
     
     # remove from DB and memory model
+    model.log.flush() # queued logs are written before the data mutex is taken, remove() deletes them
     with model.video.dataMutex():
         videos = model.video.getItems(lock=False)
         for index, video in enumerate(videos):
@@ -177,6 +199,7 @@ def add(event, queue):
     """
     Add video
     """
+    from googleapiclient.errors import HttpError
     source = event['source']
     url = event['url']
     position = event['order'] or 0
@@ -425,8 +448,153 @@ def get_yt_id(url, ignore_playlist=False):
         if query.path[:3] == '/v/': return query.path.split('/')[2]
    # returns None for invalid YouTube url
 
-def broadcast(sender = None):
+def diff(items):
+    """
+    Compare video objects with the last broadcast and return the list of operations.
+    Updates the snapshot. Must be called with deltaMutex.
+    """
+    global snapshotIds, snapshotObjects
+    newIds = [item['id'] for item in items]
+    newObjects = {item['id']: item for item in items}
+    ops = []
+
+    # removed videos
+    for id in snapshotIds:
+        if (not id in newObjects):
+            ops.append({'op': 'remove', 'id': id})
+    current = [id for id in snapshotIds if id in newObjects]
+
+    # changed fields
+    for id in current:
+        old = snapshotObjects[id]
+        new = newObjects[id]
+        if (old != new):
+            fields = {}
+            for key, value in new.items():
+                if (old.get(key) != value):
+                    fields[key] = value
+            ops.append({'op': 'update', 'id': id, 'fields': fields})
+
+    # new and moved videos
+    # videos in the longest run that is already in order stay where they are, every other video is placed after its new predecessor
+    position = {id: index for index, id in enumerate(newIds)}
+    placed = longestIncreasing(current, position)
+    existing = set(current)
+    for index, id in enumerate(newIds):
+        if (id in placed):
+            continue
+        if (id in existing):
+            current.remove(id)
+        target = 0 if index == 0 else current.index(newIds[index - 1]) + 1
+        current.insert(target, id)
+        placed.add(id)
+        if (id in existing):
+            ops.append({'op': 'move', 'id': id, 'index': target})
+        else:
+            ops.append({'op': 'insert', 'index': target, 'video': newObjects[id]})
+
+    snapshotIds = newIds
+    snapshotObjects = newObjects
+    return ops
+
+def longestIncreasing(ids, position):
+    """
+    Return set of ids that form the longest run already in increasing order of position
+    """
+    tails = [] # index into ids of the smallest tail for each run length
+    previous = [-1] * len(ids)
+    for i, id in enumerate(ids):
+        p = position[id]
+        lo, hi = 0, len(tails)
+        while (lo < hi):
+            mid = (lo + hi) // 2
+            if (position[ids[tails[mid]]] < p):
+                lo = mid + 1
+            else:
+                hi = mid
+        if (lo > 0):
+            previous[i] = tails[lo - 1]
+        if (lo == len(tails)):
+            tails.append(i)
+        else:
+            tails[lo] = i
+    res = set()
+    i = tails[-1] if tails else -1
+    while (i >= 0):
+        res.add(ids[i])
+        i = previous[i]
+    return res
+
+def _broadcastDelta(items, sender = None):
+    # must be called with deltaMutex
+    global VERSION
+    ops = diff(items)
+    if (len(ops) == 0):
+        return None
+    VERSION += 1
+    history.append((VERSION, ops))
     server.broadcast(obj={
         'namespace': 'videos',
-        'videos': data(),
-    }, sender=sender)
+        'action': 'delta',
+        'version': VERSION,
+        'ops': ops,
+    }, sender=sender, where=lambda queue: 'videosDelta' in queue.capabilities)
+
+def _snapshotMessage():
+    # must be called with deltaMutex
+    return {
+        'namespace': 'videos',
+        'action': 'snapshot',
+        'version': VERSION,
+        'videos': [snapshotObjects[id] for id in snapshotIds],
+    }
+
+def snapshot():
+    """
+    Broadcast any pending changes and return (version, list of video objects)
+    """
+    with deltaMutex:
+        items = data()
+        _broadcastDelta(items)
+        return VERSION, items
+
+def sendSnapshot(queue):
+    with deltaMutex:
+        server.send(queue, _snapshotMessage())
+
+def subscribe(event, queue):
+    """
+    Client has a copy of the list at event['version'], send the deltas it missed or a snapshot if it is too old
+    """
+    version = int(event.get('version') or 0)
+    with deltaMutex:
+        queue.capabilities.add('videosDelta')
+        if (version == VERSION):
+            return None
+        if (version > VERSION or len(history) == 0 or history[0][0] > version + 1):
+            # unknown version or too old
+            server.send(queue, _snapshotMessage())
+            return None
+        ops = []
+        for hVersion, hOps in history:
+            if (hVersion > version):
+                ops.extend(hOps)
+        server.send(queue, {
+            'namespace': 'videos',
+            'action': 'delta',
+            'version': VERSION,
+            'ops': ops,
+        })
+
+def broadcast(sender = None):
+    """
+    Send changes to the video list. Delta clients receive the operations since the last broadcast, other clients receive the full list.
+    """
+    with deltaMutex:
+        items = data()
+        _broadcastDelta(items, sender)
+        server.broadcast(obj={
+            'namespace': 'videos',
+            'videos': items,
+            'version': VERSION,
+        }, sender=sender, where=lambda queue: not 'videosDelta' in queue.capabilities)
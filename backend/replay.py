@@ -0,0 +1,81 @@
+"""
+ * Developed by Hutz Media Ltd. <info@hutzmedia.com>
+ * Copyright 2026-10-18
+ * See README.md
+"""
+
+import os
+from collections import deque
+
+import logging
+logger = logging.getLogger('piworkout-server')
+
+# recent broadcasts kept for reconnecting clients
+SIZE = int(os.getenv('REPLAY_BUFFER_SIZE', '1000')) # messages
+MAX_BYTES = int(os.getenv('REPLAY_BUFFER_MAX_BYTES', str(8 * 1024 * 1024))) # size of the retained messages and their encodings
+
+class Entry:
+    """
+    A broadcast message, see server.broadcast().
+    The encodings made for the connected clients are kept, other codecs are encoded when a client resumes (see ReplayBuffer.message()).
+    Broadcast objects are not changed after they are sent.
+    """
+    __slots__ = ('messageId', 'namespace', 'where', 'key', 'obj', 'encoded', 'size')
+
+    def __init__(self, messageId, namespace, where, key, obj, encoded):
+        self.messageId = messageId
+        self.namespace = namespace
+        self.where = where
+        self.key = key
+        self.obj = obj
+        self.encoded = encoded # codec name => encoded message, at least one
+        # the object is counted as large as its first encoding
+        self.size = sum(len(message) for message in encoded.values()) + len(next(iter(encoded.values())))
+
+class ReplayBuffer:
+    """
+    Ring buffer of recent broadcasts keyed on messageId.
+    Not thread safe, server.py holds messageMutex while using it.
+    """
+
+    def __init__(self, size: int = SIZE, maxBytes: int = MAX_BYTES):
+        self._entries = deque()
+        self._size = size
+        self._maxBytes = maxBytes
+        self._bytes = 0
+        self.evicted = 0 # messageId of the newest broadcast that is no longer in the buffer
+
+    def append(self, entry: Entry):
+        self._entries.append(entry)
+        self._bytes += entry.size
+        self._evict()
+
+    def message(self, entry: Entry, codec):
+        """
+        Entry encoded with codec, the encoding is kept for other clients resuming with the same codec
+        """
+        message = entry.encoded.get(codec.name)
+        if (message == None):
+            message = codec.encode(entry.obj)
+            entry.encoded[codec.name] = message
+            entry.size += len(message)
+            if (entry.messageId > self.evicted):
+                # still in the buffer
+                self._bytes += len(message)
+                self._evict()
+        return message
+
+    def _evict(self):
+        while (len(self._entries) > self._size or (self._bytes > self._maxBytes and len(self._entries) > 1)):
+            oldest = self._entries.popleft()
+            self._bytes -= oldest.size
+            self.evicted = oldest.messageId
+
+    def since(self, messageId: int, lastMessageId: int):
+        """
+        Entries after messageId. Returns None if broadcasts after messageId are no longer in the buffer
+        or messageId is from the future (e.g. the client was connected to a previous server process).
+        """
+        if (messageId > lastMessageId or messageId < self.evicted):
+            return None
+        return [entry for entry in self._entries if entry.messageId > messageId]
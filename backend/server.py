@@ -7,29 +7,83 @@
 import asyncio
 import websockets
 from websockets.legacy.server import serve
-import json
 import os
 import sys
-from queue import Queue, Empty
-import yt_dlp
-import yt_dlp.version
+import threading
+import time
+import traceback
+import uuid
+import urllib.parse
+from concurrent.futures import ThreadPoolExecutor
 
 import model
+import channel
+import codec
+import metrics
+import replay
+from channel import Channel
+from flowcontrol import FlowControl
+from threads import versioncheck, filewriter
 
-from namespaces import settings, connect, videos, player, logs, routines, ping, file_upload, exercises
+from namespaces import settings, connect, videos, player, logs, routines, ping, file_upload, exercises, admin
 
 import logging
 logger = logging.getLogger('piworkout-server')
 
 CLIENTS = set()
+clientsMutex = threading.Lock() # CLIENTS is read from worker threads when broadcasting
 MESSAGE_ID = 0
+BROADCAST_ID = 0 # messageId of the newest broadcast, messages sent to a single client are not replayed
+# held while a messageId is assigned and the message is queued, clients receive messages in messageId order
+messageMutex = threading.Lock()
+# recent broadcasts, a reconnecting client can resume with ?resume=messageId&epoch=epoch&capabilities=videosDelta instead of receiving init
+# capabilities (comma separated) restores what the client had enabled on its previous connection, see Channel.capabilities
+REPLAY = replay.ReplayBuffer()
+RESUME_CAPABILITIES = {'videosDelta'} # capabilities a resuming client can restore
+EPOCH = uuid.uuid4().hex # messageIds are only meaningful within the same server process
 
-ytDlpVersion = yt_dlp.version.__version__
-with yt_dlp.YoutubeDL() as ydl:
-    ytDlpVersion = ytDlpVersion + ' (latest=' + yt_dlp.Updater(ydl)._get_version_info('latest')[0] + ')'
+# handlers in these namespaces make youtube api requests, run yt-dlp, write to sqlite or rewrite files
+# they run on the executor so they never stall ping and player sync for other clients
+BLOCKING_NAMESPACES = {'settings', 'connect', 'videos', 'routines', 'logs', 'exercises'}
+EXECUTOR = ThreadPoolExecutor(max_workers=int(os.getenv('HANDLER_WORKERS', '4')), thread_name_prefix='handler')
 
+def dispatch(namespace, action, handler, message, queue, lane):
+    """
+    Run fast handlers inline and queue blocking handlers on the client's lane
+    """
+    if (namespace in BLOCKING_NAMESPACES):
+        lane.put_nowait((namespace, action, handler, message))
+    else:
+        timedHandler(namespace, action, handler, message, queue)
+
+def timedHandler(namespace, action, handler, message, queue):
+    """
+    Run handler and record how long it took
+    """
+    start = time.perf_counter()
+    error = False
+    try:
+        handler(message, queue)
+    except Exception:
+        error = True
+        raise
+    finally:
+        metrics.observe(namespace, action, time.perf_counter() - start, error, queue.id)
 
-async def receiveJson(event, queue):
+async def lane_handler(lane, queue):
+    """
+    Run blocking handlers for a single client on the executor one at a time so the client's requests keep their order
+    """
+    loop = asyncio.get_running_loop()
+    while True:
+        namespace, action, handler, message = await lane.get()
+        try:
+            await loop.run_in_executor(EXECUTOR, timedHandler, namespace, action, handler, message, queue)
+        except Exception as e:
+            logger.error(f'Error in {namespace} handler: ' + str(e))
+            logger.error(''.join(traceback.format_tb(e.__traceback__)))
+
+async def receiveJson(event, queue, lane):
     """
     Handle message from client
     """
@@ -41,70 +95,91 @@ async def receiveJson(event, queue):
 
     # handle message
     namespace = event['namespace']
+    action = str(event.get('action') or event.get('method') or '')
     match namespace:
         case 'up':
-            None # clients send frequently to get back messages
+            return None # clients send frequently to get back messages
         case 'settings':
-            settings.receive(event, queue)
+            handler = settings.receive
         case 'connect':
-            connect.receive(event, queue)
+            handler = connect.receive
         case 'videos':
-            videos.receive(event, queue)
+            handler = videos.receive
         case 'player':
-            player.receive(event, queue)
+            handler = player.receive
         case 'routines':
-            routines.receive(event, queue)
+            handler = routines.receive
         case 'logs':
-            logs.receive(event, queue)
+            handler = logs.receive
         case 'ping':
-            ping.receive(event, queue)
+            handler = ping.receive
+        case 'admin':
+            handler = admin.receive
         case 'exit':
             sys.exit() # restart application
         case _:
             logger.warning(f'  namespace {namespace} not handled.')
+            return None
+    dispatch(namespace, action, handler, event, queue, lane)
 
             
-async def receiveBinary(binaryMessage, queue):
-    # magic number (8), version (8), namespace (28) .... 
-    magicNumber = binaryMessage[0:8]
-    if (magicNumber != b'\x89webSOK\n'):
-        logger.warn('Incoming binary message did not contain correct magicNumber.')
-        return None
-    
-    #version = message[8:16].decode('ascii').rstrip('\x00')
-    namespace = binaryMessage[16:44].decode('ascii').rstrip('\x00')
+async def receiveBinary(binaryMessage, namespace, action, queue, lane):
     match namespace:
         case 'file-upload':
-            file_upload.binaryReceive(binaryMessage, queue)
+            handler = file_upload.binaryReceive
         case 'exercises':
-            exercises.binaryReceive(binaryMessage, queue)
+            handler = exercises.binaryReceive
         case _:
             logger.warning(f'  binary namespace {namespace} not handled.')
+            return None
+    dispatch(namespace, action, handler, binaryMessage, queue, lane)
 
 
-async def consumer_handler(websocket, queue):
+async def consumer_handler(websocket, queue, lane):
     # receive messages
+    flow = FlowControl()
     try:
         async for message in websocket:
             jsonMessage = None
             binaryMessage = None
             try:
-                # determine if a binary message
-                if (message[0] == '{'):
+                if (isinstance(message, str)):
                     # normal json message
-                    jsonMessage = json.loads(message)
-                else:
-                    # binary message
+                    jsonMessage = codec.JSON.decode(message)
+                    namespace = jsonMessage.get('namespace', '')
+                elif (codec.isBinaryMessage(message)):
+                    # binary namespace message (file upload, exercise image)
                     binaryMessage = message
-            except ValueError:
-                logger.debug('Decoding json message has failed.')
+                    header = codec.parseBinaryHeader(message)
+                    namespace = header.namespace
+                    action = header.action
+                elif (queue.codec.binary):
+                    # binary encoded object (msgpack)
+                    jsonMessage = queue.codec.decode(message)
+                    namespace = jsonMessage.get('namespace', '')
+                else:
+                    logger.warning('Incoming binary message did not contain correct magicNumber.')
+                    continue
+            except (ValueError, AttributeError):
+                logger.debug('Decoding message has failed.')
                 logger.debug(message)
+                continue
+
+            metrics.inc('piworkout_messages_in_total', namespace=namespace)
+            metrics.inc('piworkout_bytes_in_total', len(message), namespace=namespace)
+
+            # inbound flow control, waiting here stops reading from the socket until the client is within its limits
+            wait = flow.take(namespace)
+            if (wait > 0):
+                await asyncio.sleep(wait)
+
             if (jsonMessage):
-                await receiveJson(jsonMessage, queue)
+                await receiveJson(jsonMessage, queue, lane)
             elif (binaryMessage):
-                await receiveBinary(binaryMessage, queue)
-                
-            await asyncio.sleep(0.04)  # yield control to the event loop
+                await receiveBinary(binaryMessage, namespace, action, queue, lane)
+                if (namespace == 'file-upload'):
+                    # stop reading from this client while the disk is behind
+                    await filewriter.writable()
     except websockets.exceptions.ConnectionClosed:
         logger.debug('  client disconnected early')
 
@@ -113,81 +188,205 @@ async def producer_handler(websocket, queue):
     # send messages
     try:
         while True:
-            # get message from queue, block if not messages
-            try:
-                message = queue.get(False)
-                await websocket.send(message)
-                queue.task_done()
-            except Empty:
-                await asyncio.sleep(0.04)  # yield control to the event loop (tickrate 25fps)
+            # wait for next message, worker threads wake the loop with call_soon_threadsafe
+            message = await queue.get()
+            if (message is channel.RESYNC):
+                # client fell behind and its unsent messages were discarded
+                message = initMessage(queue.codec)
+                countOut('init', message)
+            elif (message is channel.DISCONNECT):
+                await websocket.close(1008, 'client is not reading messages')
+                return None
+            elif (type(message) is channel.Deferred):
+                message = message.encode()
+            await websocket.send(message)
     except websockets.exceptions.ConnectionClosed:
         logger.warning('Connecting closed while attempting to send.')
 
+# encoded init message cache, codec name => (key, encoded message)
+# the key is read before the data is collected so a change made while building marks the entry stale
+initCache = {}
+initCacheMutex = threading.Lock()
+
+def initKey():
+    # a resuming client replays the broadcasts after the init messageId, pings and other sends leave the cache valid
+    return (BROADCAST_ID, model.settings.version, model.video.version, videos.VERSION, model.routines.version, player.MODEL.version, versioncheck.versionString())
+
+def initMessage(codec):
+    """
+    Get encoded init message with everything a client needs.
+    The message is only rebuilt when a model has changed, a reconnect storm serializes it once per codec.
+    """
+    with initCacheMutex:
+        key = initKey()
+        cached = initCache.get(codec.name)
+        if (cached != None and cached[0] == key):
+            return cached[1]
+        message = buildInitMessage(codec)
+        initCache[codec.name] = (key, message)
+        return message
+
+def buildInitMessage(codec):
+    """
+    Create encoded init message
+    """
+    messageId = BROADCAST_ID # state includes everything broadcast up to here
+    videosVersion, videosData = videos.snapshot()
+    obj = {
+        'namespace': 'init',
+        'messageId': messageId,
+        'epoch': EPOCH,
+        'data': {
+            'settings': settings.data(),
+            'connected': model.settings.get('youtubeApiToken', '') != '',
+            'videos': videosData,
+            'videosVersion': videosVersion,
+            'player': player.data(),
+            'routines': routines.data(),
+            'versions': {
+                'piworkoutServer': '1.0.0',
+                'ytDlp': versioncheck.versionString(),
+            }
+        },
+    }
+    return codec.encode(obj)
+
 async def handler(websocket):
-    logger.debug('Creating thread safe queue.')
-    queue = Queue()
-    CLIENTS.add(queue)
-    logger.info('  client connected count=' + str(len(CLIENTS)))
+    logger.debug('Creating client channel.')
+    queue = Channel(asyncio.get_running_loop(), codec.negotiate(websocket.subprotocol))
+    resumed = resume(websocket.path, queue)
+    if (not resumed):
+        with clientsMutex:
+            CLIENTS.add(queue)
+    logger.info('  client connected count=' + str(len(CLIENTS)) + ', codec=' + queue.codec.name + ', resumed=' + str(resumed))
     try:
         # send initial message
-        obj = {
-            'namespace': 'init',
-            'data': {
-                'settings': settings.data(),
-                'connected': model.settings.get('youtubeApiToken', '') != '',
-                'videos': videos.data(),
-                'player': player.data(),
-                'routines': routines.data(),
-                'versions': {
-                    'piworkoutServer': '1.0.0',
-                    'ytDlp': ytDlpVersion,
-                }
-            },
-        }
-        
         try:
-            queue.put(json.dumps(obj))
+            if (not resumed):
+                message = initMessage(queue.codec)
+                queue.put(message)
+                countOut('init', message)
         except websockets.exceptions.ConnectionClosed:
             logger.debug('  client disconnected early')
         except:
             logger.error('  error sending init message')
 
-        # receive messages / send messages
-        consumer_task = asyncio.ensure_future(consumer_handler(websocket, queue))
+        # receive messages / send messages / run blocking handlers
+        lane = asyncio.Queue()
+        consumer_task = asyncio.ensure_future(consumer_handler(websocket, queue, lane))
         producer_task = asyncio.ensure_future(producer_handler(websocket, queue))
+        lane_task = asyncio.ensure_future(lane_handler(lane, queue))
         done, pending = await asyncio.wait(
-            [consumer_task, producer_task],
+            [consumer_task, producer_task, lane_task],
             return_when=asyncio.FIRST_COMPLETED,
         )
         for task in pending:
             task.cancel()
     finally:
-        CLIENTS.remove(queue)
+        with clientsMutex:
+            CLIENTS.remove(queue)
+        queue.close()
+        player.disconnected(queue)
         logger.info('  client disconnected count=' + str(len(CLIENTS)))
 
-def send(queue, obj):
+def resume(path, queue):
+    """
+    Replay broadcasts a reconnecting client missed. Returns False if the client has to receive init instead.
+    The client is added to CLIENTS while messageMutex is held so no broadcast is missed or sent twice.
+    """
+    query = urllib.parse.parse_qs(urllib.parse.urlparse(path).query)
+    if (not 'resume' in query or query.get('epoch', [''])[0] != EPOCH):
+        return False
+    try:
+        messageId = int(query['resume'][0])
+    except ValueError:
+        return False
+    # replayed messages are filtered for the client it was, e.g. a delta client needs the delta broadcasts
+    for item in query.get('capabilities', []):
+        queue.capabilities.update(RESUME_CAPABILITIES.intersection(item.split(',')))
+    with messageMutex:
+        entries = REPLAY.since(messageId, MESSAGE_ID)
+        if (entries == None):
+            # too far behind
+            return False
+        with clientsMutex:
+            CLIENTS.add(queue)
+        entries = [entry for entry in entries if entry.where == None or entry.where(queue)]
+        queue.put(queue.codec.encode({
+            'namespace': 'resume',
+            'messageId': messageId,
+            'epoch': EPOCH,
+            'count': len(entries), # number of replayed messages that follow
+        }))
+        for entry in entries:
+            message = REPLAY.message(entry, queue.codec)
+            queue.put(message, entry.key)
+            countOut(entry.namespace, message)
+    return True
+
+def send(queue, obj, key = None, prepare = None):
+    """
+    Send message to a single client. If key is specified the message replaces any unsent message with the same key.
+    If prepare is specified the message is encoded when it is sent, after prepare(obj) is called (see channel.Deferred).
+    Returns the size of the queued message.
+    """
     global MESSAGE_ID
-    MESSAGE_ID += 1
-    obj['messageId'] = MESSAGE_ID
-    queue.put_nowait(json.dumps(obj))
+    with messageMutex:
+        MESSAGE_ID += 1
+        obj['messageId'] = MESSAGE_ID
+        if (prepare != None):
+            message = channel.Deferred(obj, queue.codec, prepare)
+        else:
+            message = queue.codec.encode(obj)
+        queue.put(message, key)
+    countOut(obj.get('namespace', ''), message)
+    return len(message)
 
-def broadcast(obj, sender = None):
+def broadcast(obj, sender = None, where = None, key = None):
     """
     Send message to all users. If sender is specified do not send back to sender.
+    If where is specified only send to clients where where(queue) is True.
+    If key is specified the message replaces any unsent message with the same key (latest value wins).
+    The message is encoded once per codec in use and the same encoded message is shared by every client.
+    The message is kept in REPLAY for clients that reconnect, other codecs are encoded when such a client resumes.
     """
-    global MESSAGE_ID
-    MESSAGE_ID += 1
-    obj['messageId'] = MESSAGE_ID
-    for queue in CLIENTS:
-        if (sender == queue):
-            continue
-        queue.put_nowait(json.dumps(obj))
+    global MESSAGE_ID, BROADCAST_ID
+    encoded = {} # codec name => encoded message
+    with messageMutex:
+        MESSAGE_ID += 1
+        BROADCAST_ID = MESSAGE_ID
+        obj['messageId'] = MESSAGE_ID
+        with clientsMutex:
+            clients = list(CLIENTS)
+        for queue in clients:
+            if (sender == queue or (where != None and not where(queue))):
+                continue
+            message = encoded.get(queue.codec.name)
+            if (message == None):
+                message = queue.codec.encode(obj)
+                encoded[queue.codec.name] = message
+            queue.put(message, key)
+            countOut(obj.get('namespace', ''), message)
+        if (len(encoded) == 0):
+            # no client received the message, keep one encoding so its size is known
+            encoded[codec.JSON.name] = codec.JSON.encode(obj)
+        REPLAY.append(replay.Entry(MESSAGE_ID, obj.get('namespace', ''), where, key, obj, encoded))
+
+def countOut(namespace, message):
+    metrics.inc('piworkout_messages_out_total', namespace=namespace)
+    metrics.inc('piworkout_bytes_out_total', len(message), namespace=namespace)
 
 
-def start():
+def start(listening = None):
+    """
+    Start websocket server. listening() is called once the server accepts connections.
+    """
     host = os.environ['BACKEND_HOST']
     port = os.environ['BACKEND_PORT']
     
-    start_server = serve(handler, host, port)
+    start_server = serve(handler, host, port, subprotocols=list(codec.SUBPROTOCOLS.keys()), process_request=metrics.processRequest)
     asyncio.get_event_loop().run_until_complete(start_server)
+    asyncio.get_event_loop().create_task(metrics.logLatencyPeriodically())
+    if (listening != None):
+        listening()
     asyncio.get_event_loop().run_forever()
\ No newline at end of file
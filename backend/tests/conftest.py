@@ -0,0 +1,31 @@
+"""
+ * Developed by Hutz Media Ltd. <info@hutzmedia.com>
+ * Copyright 2026-10-18
+ * See README.md
+"""
+
+# run from backend/: python -m pytest tests
+# model.py opens ./db/database.sqlite3 when it is imported, tests run in a temporary directory so the app database is not touched
+
+import os
+import sys
+import tempfile
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.chdir(tempfile.mkdtemp())
+os.mkdir('db')
+
+import database
+import migrations
+
+@pytest.fixture
+def db(tmp_path):
+    """
+    Migrated database in a temporary file
+    """
+    db = database.Database(str(tmp_path / 'test.sqlite3'))
+    migrations.migrate(db)
+    yield db
+    db.close()
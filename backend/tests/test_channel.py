@@ -0,0 +1,110 @@
+"""
+ * Developed by Hutz Media Ltd. <info@hutzmedia.com>
+ * Copyright 2026-10-18
+ * See README.md
+"""
+
+import asyncio
+
+import pytest
+
+import channel
+import codec
+
+def run(test):
+    """
+    Run test(channel) on an event loop, messages put by the test are delivered before it reads them
+    """
+    async def main():
+        return await test(channel.Channel(asyncio.get_running_loop(), codec.JSON))
+    return asyncio.run(main())
+
+async def drain(queue):
+    await asyncio.sleep(0) # let call_soon deliver the puts
+    messages = []
+    while (len(queue) > 0):
+        messages.append(await queue.get())
+    return messages
+
+@pytest.fixture
+def limits(monkeypatch):
+    def set(policy, messages = 1000, bytes = 1024 * 1024):
+        monkeypatch.setattr(channel, 'POLICY', policy)
+        monkeypatch.setattr(channel, 'MAX_MESSAGES', messages)
+        monkeypatch.setattr(channel, 'MAX_BYTES', bytes)
+    return set
+
+def test_messages_keep_their_order():
+    async def test(queue):
+        for message in (b'a', b'b', b'c'):
+            queue.put(message)
+        assert await drain(queue) == [b'a', b'b', b'c']
+        assert queue.size() == 0
+    run(test)
+
+def test_keyed_messages_coalesce():
+    async def test(queue):
+        for i in range(5):
+            queue.put(b'progress ' + str(i).encode(), 'progress:1')
+        assert await drain(queue) == [b'progress 4']
+        assert queue.size() == 0
+    run(test)
+
+def test_replaced_slot_moves_behind_newer_messages():
+    async def test(queue):
+        queue.put(b'progress 1', 'progress:1')
+        queue.put(b'list')
+        queue.put(b'progress 2', 'progress:1')
+        queue.put(b'other', 'progress:2')
+        assert await drain(queue) == [b'list', b'progress 2', b'other']
+    run(test)
+
+def test_drop_policy_drops_keyed_messages_first(limits):
+    limits('drop', messages=3)
+    async def test(queue):
+        queue.put(b'progress 1', 'progress:1')
+        queue.put(b'progress 2', 'progress:2')
+        queue.put(b'a')
+        queue.put(b'b')
+        messages = await drain(queue)
+        assert messages == [b'progress 2', b'a', b'b']
+        assert queue.dropped == 1
+    run(test)
+
+def test_drop_policy_resyncs_when_only_critical_messages_are_waiting(limits):
+    limits('drop', messages=2)
+    async def test(queue):
+        for message in (b'a', b'b', b'c'):
+            queue.put(message)
+        await asyncio.sleep(0)
+        assert await queue.get() is channel.RESYNC
+        assert len(queue) == 0 and queue.size() == 0
+    run(test)
+
+def test_resync_policy(limits):
+    limits('resync', bytes=10)
+    async def test(queue):
+        queue.put(b'12345678')
+        queue.put(b'12345678')
+        queue.put(b'after')
+        assert await drain(queue) == [channel.RESYNC, b'after']
+    run(test)
+
+def test_disconnect_policy(limits):
+    limits('disconnect', messages=1)
+    async def test(queue):
+        queue.put(b'a')
+        queue.put(b'b')
+        queue.put(b'ignored')
+        assert await drain(queue) == [channel.DISCONNECT]
+        assert queue.closed
+    run(test)
+
+def test_deferred_message_is_prepared_when_encoded():
+    async def test(queue):
+        obj = {'namespace': 'ping', 't2': 0}
+        queue.put(channel.Deferred(obj, codec.JSON, lambda obj: obj.update(t2=5)))
+        message = (await drain(queue))[0]
+        assert codec.JSON.decode(message.encode()) == {'namespace': 'ping', 't2': 5}
+        assert queue.size() == 0
+    run(test)
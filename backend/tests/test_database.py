@@ -0,0 +1,27 @@
+"""
+ * Developed by Hutz Media Ltd. <info@hutzmedia.com>
+ * Copyright 2026-10-18
+ * See README.md
+"""
+
+def autoVacuum(db):
+    return db.readOne('PRAGMA auto_vacuum')['auto_vacuum']
+
+def fillAndDelete(db):
+    with db.write() as cursor:
+        cursor.executemany('INSERT INTO logs (video_id, action, data, created_at) VALUES (?, ?, ?, ?)', [(1, 'onPlay', 'x' * 1000, i) for i in range(2000)])
+    with db.write() as cursor:
+        cursor.execute('DELETE FROM logs')
+
+def test_compact_does_not_switch_vacuum_mode(db):
+    fillAndDelete(db)
+    assert db.compact() == 0
+    assert autoVacuum(db) == 0
+
+def test_compact_frees_pages_after_incremental_vacuum_is_enabled(db):
+    assert db.enableIncrementalVacuum()
+    assert not db.enableIncrementalVacuum()
+    assert autoVacuum(db) == 2
+    fillAndDelete(db)
+    assert db.compact() > 0
+    assert db.readOne('PRAGMA freelist_count')['freelist_count'] == 0
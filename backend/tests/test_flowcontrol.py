@@ -0,0 +1,32 @@
+"""
+ * Developed by Hutz Media Ltd. <info@hutzmedia.com>
+ * Copyright 2026-10-18
+ * See README.md
+"""
+
+import flowcontrol
+
+class Clock:
+    def __init__(self):
+        self.now = 100.0
+
+    def monotonic(self):
+        return self.now
+
+def test_token_bucket(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(flowcontrol.time, 'monotonic', clock.monotonic)
+    bucket = flowcontrol.TokenBucket(rate=10, burst=2)
+    assert bucket.take() == 0
+    assert bucket.take() == 0
+    assert bucket.take() == 0.1 # one token short at 10 tokens per second
+    clock.now += 1
+    assert bucket.take() == 0 # refilled up to burst only
+    assert bucket.take() == 0
+    assert bucket.take() > 0
+
+def test_parse_limits():
+    assert flowcontrol.parseLimits('player=20:40, file-upload=500:500,bad') == {
+        'player': (20.0, 40.0),
+        'file-upload': (500.0, 500.0),
+    }
@@ -0,0 +1,45 @@
+"""
+ * Developed by Hutz Media Ltd. <info@hutzmedia.com>
+ * Copyright 2026-10-18
+ * See README.md
+"""
+
+import codec
+import model
+from namespaces import logs
+
+class Queue:
+    """
+    Channel stand-in, like a real channel it does not see puts from worker threads before the event loop runs them
+    """
+    def __init__(self):
+        self.codec = codec.JSON
+        self.closed = False
+        self.messages = []
+
+    def put(self, message, key = None):
+        self.messages.append(codec.JSON.decode(message))
+
+    def size(self):
+        return 0
+
+def test_stream_pauses_after_queuing_its_limit(db, monkeypatch):
+    monkeypatch.setattr(model, 'log', model.LogModel(db, None))
+    for i in range(100):
+        model.log.create({'video_id': 7, 'action': 'onPlay', 'data': str(i)})
+    model.log.flush()
+    monkeypatch.setattr(logs, 'STREAM_MAX_QUEUED', 1000)
+
+    queue = Queue()
+    logs.receive({'namespace': 'logs', 'method': 'GET', 'videoId': 7, 'limit': 10, 'stream': True}, queue)
+    sizes = [len(codec.JSON.encode(message)) for message in queue.messages]
+    assert queue.messages[-1]['paused'] and not queue.messages[-1]['done']
+    assert sum(sizes[:-1]) >= 1000 > sum(sizes[:-2])
+
+    # the client continues from the paused page's cursor and gets the rest
+    received = sum(len(message['items']) for message in queue.messages)
+    before = queue.messages[-1]['before']
+    queue = Queue()
+    logs.receive({'namespace': 'logs', 'method': 'GET', 'videoId': 7, 'limit': 50, 'stream': True, 'before': before}, queue)
+    assert queue.messages[-1]['done']
+    assert received + sum(len(message['items']) for message in queue.messages) == 100
@@ -0,0 +1,22 @@
+"""
+ * Developed by Hutz Media Ltd. <info@hutzmedia.com>
+ * Copyright 2026-10-18
+ * See README.md
+"""
+
+import asyncio
+import http
+
+import metrics
+from threads import downloader
+
+def test_metrics_path_is_answered_without_handshake():
+    status, headers, body = asyncio.run(metrics.processRequest(metrics.PATH, {}))
+    assert status == http.HTTPStatus.OK
+    assert b'piworkout_downloader_queue_length 0.0\n' in body
+
+def test_other_paths_continue_with_handshake():
+    assert asyncio.run(metrics.processRequest('/?resume=1', {})) == None
+
+def test_downloader_stats():
+    assert downloader.DownloaderThread().stats() == (0, 0)
@@ -0,0 +1,69 @@
+"""
+ * Developed by Hutz Media Ltd. <info@hutzmedia.com>
+ * Copyright 2026-10-18
+ * See README.md
+"""
+
+import sqlite3
+
+import database
+import migrations
+
+def baseline(path):
+    """
+    Database created before migrations existed: the version 1 tables, no schema_version and duplicate settings
+    """
+    connection = sqlite3.connect(path)
+    for sql in migrations.MIGRATIONS[0][2]:
+        connection.execute(sql)
+    connection.executemany('INSERT INTO settings (name, value) VALUES (?, ?)', [
+        ('playlistUrl', 'old'),
+        ('playlistUrl', 'new'),
+        ('youtubeCookie', 'cookie'),
+    ])
+    connection.execute('INSERT INTO videos (videoId, title) VALUES (?, ?)', ('abc', 'kept'))
+    connection.commit()
+    connection.close()
+
+def indexes(db, table):
+    return {row['name'] for row in db.read("SELECT name FROM sqlite_master WHERE type = 'index' AND tbl_name = ? AND sql IS NOT NULL", (table,))}
+
+def test_migrates_baseline_database(tmp_path):
+    path = str(tmp_path / 'baseline.sqlite3')
+    baseline(path)
+    db = database.Database(path)
+    migrations.migrate(db)
+
+    with db.write() as cursor:
+        assert migrations.version(cursor) == migrations.MIGRATIONS[-1][0]
+    assert db.read('SELECT name, value FROM settings ORDER BY name') == [
+        {'name': 'playlistUrl', 'value': 'new'}, # newest duplicate is kept
+        {'name': 'youtubeCookie', 'value': 'cookie'},
+    ]
+    assert db.read('SELECT videoId, title FROM videos') == [{'videoId': 'abc', 'title': 'kept'}]
+    assert 'settings_name' in indexes(db, 'settings')
+    assert indexes(db, 'exercises') == {'exercises_routineId_order'}
+    assert {'logs_video_id_created_at', 'logs_created_at'} <= indexes(db, 'logs')
+    db.close()
+
+def test_migrate_is_idempotent(db):
+    with db.write() as cursor:
+        before = migrations.version(cursor)
+    migrations.migrate(db)
+    assert db.readOne('SELECT COUNT(*) AS count FROM schema_version')['count'] == len(migrations.MIGRATIONS)
+    with db.write() as cursor:
+        assert migrations.version(cursor) == before
+
+def test_failed_migration_rolls_back(db, monkeypatch):
+    number = migrations.MIGRATIONS[-1][0] + 1
+    monkeypatch.setattr(migrations, 'MIGRATIONS', migrations.MIGRATIONS + [
+        (number, 'broken', ['CREATE TABLE broken (id INTEGER)', 'INSERT INTO missing VALUES (1)']),
+    ])
+    try:
+        migrations.migrate(db)
+        assert False, 'migration should fail'
+    except sqlite3.OperationalError:
+        pass
+    assert db.readOne("SELECT name FROM sqlite_master WHERE name = 'broken'") == None
+    with db.write() as cursor:
+        assert migrations.version(cursor) == number - 1
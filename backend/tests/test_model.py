@@ -0,0 +1,97 @@
+"""
+ * Developed by Hutz Media Ltd. <info@hutzmedia.com>
+ * Copyright 2026-10-18
+ * See README.md
+"""
+
+import model
+
+def test_log_pages_walk_every_log_once(db):
+    logs = model.LogModel(db, None)
+    with db.write() as cursor:
+        # several logs share a created_at, the id breaks ties
+        cursor.executemany('INSERT INTO logs (video_id, action, data, created_at) VALUES (?, ?, ?, ?)', [(1, 'onPlay', str(i), 1000 + i // 3) for i in range(250)])
+        cursor.execute('INSERT INTO logs (video_id, action, data, created_at) VALUES (2, "onPlay", "other video", 5000)')
+
+    seen = []
+    before = None
+    while (True):
+        items, more = logs.getPage(1, limit=40, before=before)
+        seen += [item['data'] for item in items]
+        if (not more):
+            break
+        before = (items[-1]['created_at'], items[-1]['id'])
+    assert seen == [str(i) for i in reversed(range(250))]
+
+    newest = logs.getPage(1, limit=5)[0]
+    items, more = logs.getPage(1, limit=3, after=(newest[-1]['created_at'], newest[-1]['id']))
+    # the 3 logs after the cursor, newest first, '249' is left for the next page
+    assert [item['data'] for item in items] == ['248', '247', '246']
+    assert more
+
+def test_log_page_filters_actions_and_clamps_limit(db):
+    logs = model.LogModel(db, None)
+    for i in range(10):
+        logs.create({'video_id': 1, 'action': 'onPause' if i % 2 else 'onPlay', 'data': str(i)})
+    items, more = logs.getPage(1, limit=100, actions=['onPause'])
+    assert [item['action'] for item in items] == ['onPause'] * 5
+    assert not more
+    items, more = logs.getPage(1, limit=0)
+    assert len(items) == 1 and more
+
+def test_routines_load_exercises_into_their_routine(db):
+    routines = model.RoutineModel(db, None)
+    first = model.Routine(exercises=[])
+    second = model.Routine(exercises=[])
+    routines.insert(first)
+    routines.insert(second)
+    for routine in (first, second, first):
+        routines.insertExercise(routine, model.Exercise())
+
+    loaded = model.RoutineModel(db, None)
+    assert [[exercise.id for exercise in routine.exercises] for routine in loaded.data()] == [[1, 3], [2]]
+    assert all(exercise.routineId == routine.id for routine in loaded.data() for exercise in routine.exercises)
+
+def test_routine_reorder_is_saved(db):
+    routines = model.RoutineModel(db, None)
+    items = [model.Routine(exercises=[]) for i in range(3)]
+    for routine in items:
+        routines.insert(routine)
+    for i in range(3):
+        routines.insertExercise(items[0], model.Exercise())
+
+    routines.reorder([3, 1]) # routine 2 is not listed and keeps its place after the listed ones
+    routines.reorderExercises(items[0], [3])
+    assert [routine.id for routine in routines.data()] == [3, 1, 2]
+
+    loaded = model.RoutineModel(db, None)
+    assert [(routine.id, routine.order) for routine in loaded.data()] == [(3, 0), (1, 1), (2, 2)]
+    assert [(exercise.id, exercise.order) for exercise in loaded.byId(1).exercises] == [(3, 0), (1, 1), (2, 2)]
+    assert loaded.exerciseById(loaded.byId(1), 3).order == 0
+
+def failingWrite():
+    raise OSError('disk I/O error')
+
+def test_failed_log_flush_is_retried(db, monkeypatch):
+    logs = model.LogModel(db, None)
+    for i in range(3):
+        logs.create({'video_id': 1, 'action': 'onPlay', 'data': str(i)})
+    write = db.write
+    monkeypatch.setattr(db, 'write', failingWrite)
+    logs.flush()
+    assert logs.failures == 1 and logs.pending() == 3
+    logs.create({'video_id': 1, 'action': 'onPlay', 'data': '3'})
+
+    monkeypatch.setattr(db, 'write', write)
+    logs.flush()
+    assert logs.pending() == 0
+    assert [item['data'] for item in logs.getPage(1)[0]] == ['3', '2', '1', '0']
+
+def test_log_queue_is_capped_while_writes_fail(db, monkeypatch):
+    monkeypatch.setattr(model, 'LOG_MAX_PENDING', 5)
+    logs = model.LogModel(db, None)
+    monkeypatch.setattr(db, 'write', failingWrite)
+    for i in range(8):
+        logs.create({'video_id': 1, 'action': 'onPlay', 'data': str(i)})
+    logs.flush()
+    assert logs.pending() == 5 and logs.dropped == 3
@@ -0,0 +1,51 @@
+"""
+ * Developed by Hutz Media Ltd. <info@hutzmedia.com>
+ * Copyright 2026-10-18
+ * See README.md
+"""
+
+import codec
+import replay
+
+def entry(messageId, size = 10):
+    return replay.Entry(messageId, 'videos', None, None, {'namespace': 'videos'}, {'json': b'x' * size})
+
+def test_since_returns_missed_entries():
+    buffer = replay.ReplayBuffer(size=10, maxBytes=1000)
+    for messageId in range(1, 6):
+        buffer.append(entry(messageId))
+    assert [item.messageId for item in buffer.since(3, 5)] == [4, 5]
+    assert buffer.since(5, 5) == []
+
+def test_since_future_message_id():
+    buffer = replay.ReplayBuffer(size=10, maxBytes=1000)
+    buffer.append(entry(1))
+    assert buffer.since(2, 1) == None
+
+def test_evicted_by_count():
+    buffer = replay.ReplayBuffer(size=3, maxBytes=1000)
+    for messageId in range(1, 6):
+        buffer.append(entry(messageId))
+    assert buffer.since(1, 5) == None
+    assert [item.messageId for item in buffer.since(2, 5)] == [3, 4, 5]
+
+def test_size_counts_the_object_and_its_encoding():
+    assert entry(1, 10).size == 20
+    buffer = replay.ReplayBuffer(size=100, maxBytes=50)
+    for messageId in range(1, 5):
+        buffer.append(entry(messageId, 10))
+    # two entries of 20 bytes fit
+    assert buffer.since(1, 4) == None
+    assert [item.messageId for item in buffer.since(2, 4)] == [3, 4]
+
+def test_other_codecs_are_encoded_on_resume():
+    buffer = replay.ReplayBuffer(size=10, maxBytes=1000)
+    item = entry(1)
+    buffer.append(item)
+    message = buffer.message(item, codec.JSON)
+    assert message == b'x' * 10 # encoding made for the connected clients
+    if (codec.MSGPACK != None):
+        message = buffer.message(item, codec.MSGPACK)
+        assert codec.MSGPACK.decode(message)['namespace'] == 'videos'
+        assert buffer.message(item, codec.MSGPACK) is message
+        assert item.size == 20 + len(message)
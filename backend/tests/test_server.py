@@ -0,0 +1,33 @@
+"""
+ * Developed by Hutz Media Ltd. <info@hutzmedia.com>
+ * Copyright 2026-10-18
+ * See README.md
+"""
+
+import codec
+import server
+
+class Queue:
+    """
+    Channel stand-in that keeps what was put
+    """
+    def __init__(self):
+        self.codec = codec.JSON
+        self.messages = []
+
+    def put(self, message, key = None):
+        self.messages.append(message)
+
+def test_init_message_is_reused_after_a_send(monkeypatch):
+    monkeypatch.setattr(server, 'initCache', {})
+    first = server.initMessage(codec.JSON)
+    server.send(Queue(), {'namespace': 'ping'})
+    assert server.initMessage(codec.JSON) is first
+
+def test_init_message_is_rebuilt_after_a_broadcast(monkeypatch):
+    monkeypatch.setattr(server, 'initCache', {})
+    first = server.initMessage(codec.JSON)
+    server.broadcast({'namespace': 'ping'})
+    message = server.initMessage(codec.JSON)
+    assert message is not first
+    assert codec.JSON.decode(message)['messageId'] == server.BROADCAST_ID
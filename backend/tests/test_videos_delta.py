@@ -0,0 +1,101 @@
+"""
+ * Developed by Hutz Media Ltd. <info@hutzmedia.com>
+ * Copyright 2026-10-18
+ * See README.md
+"""
+
+import random
+
+import pytest
+
+from namespaces import videos
+
+@pytest.fixture(autouse=True)
+def snapshot():
+    videos.snapshotIds = []
+    videos.snapshotObjects = {}
+    yield
+    videos.snapshotIds = []
+    videos.snapshotObjects = {}
+
+def video(id, title = None):
+    return {'id': id, 'title': title or ('video ' + str(id)), 'position': 0.0}
+
+def apply(items, ops):
+    """
+    Apply delta operations the way a client does
+    """
+    items = [dict(item) for item in items]
+    for op in ops:
+        if (op['op'] == 'remove'):
+            items = [item for item in items if item['id'] != op['id']]
+        elif (op['op'] == 'update'):
+            for item in items:
+                if (item['id'] == op['id']):
+                    item.update(op['fields'])
+        elif (op['op'] == 'insert'):
+            items.insert(op['index'], op['video'])
+        elif (op['op'] == 'move'):
+            moved = next(item for item in items if item['id'] == op['id'])
+            items.remove(moved)
+            items.insert(op['index'], moved)
+    return items
+
+def test_first_diff_inserts_everything():
+    items = [video(1), video(2), video(3)]
+    ops = videos.diff(items)
+    assert [op['op'] for op in ops] == ['insert', 'insert', 'insert']
+    assert apply([], ops) == items
+
+def test_unchanged_list_has_no_ops():
+    items = [video(1), video(2)]
+    videos.diff(items)
+    assert videos.diff([dict(item) for item in items]) == []
+
+def test_update_only_sends_changed_fields():
+    videos.diff([video(1), video(2)])
+    changed = video(2)
+    changed['position'] = 12.5
+    ops = videos.diff([video(1), changed])
+    assert ops == [{'op': 'update', 'id': 2, 'fields': {'position': 12.5}}]
+
+def test_move_to_front_is_one_op():
+    items = [video(id) for id in range(1, 11)]
+    videos.diff(items)
+    moved = [items[-1]] + items[:-1]
+    ops = videos.diff(moved)
+    assert ops == [{'op': 'move', 'id': 10, 'index': 0}]
+    assert apply(items, ops) == moved
+
+def test_remove_and_insert():
+    items = [video(1), video(2), video(3)]
+    videos.diff(items)
+    changed = [video(1), video(4), video(3)]
+    ops = videos.diff(changed)
+    assert {'op': 'remove', 'id': 2} in ops
+    assert apply(items, ops) == changed
+
+def test_random_changes_apply_to_the_new_list():
+    rng = random.Random(1)
+    items = [video(id) for id in range(1, 41)]
+    videos.diff(items)
+    nextId = 41
+    for i in range(200):
+        changed = [dict(item) for item in items if rng.random() > 0.1]
+        rng.shuffle(changed) if (i % 3 == 0) else None
+        for n in range(rng.randint(0, 3)):
+            changed.insert(rng.randint(0, len(changed)), video(nextId))
+            nextId += 1
+        for item in changed:
+            if (rng.random() < 0.1):
+                item['title'] = 'renamed ' + str(i)
+        ops = videos.diff(changed)
+        assert apply(items, ops) == changed
+        items = changed
+
+def test_longest_increasing():
+    position = {id: index for index, id in enumerate([1, 2, 3, 4, 5, 6])}
+    assert videos.longestIncreasing([], position) == set()
+    assert videos.longestIncreasing([1, 2, 3], position) == {1, 2, 3}
+    assert videos.longestIncreasing([6, 1, 2, 3], position) == {1, 2, 3}
+    assert len(videos.longestIncreasing([2, 1, 4, 3, 6, 5], position)) == 3
@@ -8,7 +8,6 @@ import threading
 import time
 import threading
 import time
-import yt_dlp
 import os
 import shlex
 
@@ -45,7 +44,7 @@ class DownloaderThread:
                         'namespace': 'videos',
                         'video': videos[1].toObject(),
                         'source': 'progressHook',
-                    })
+                    }, key='progress:' + str(videos[1].id))
 
             with self._mutex:
                 l = len(self._queue)
@@ -102,6 +101,7 @@ class DownloaderThread:
                 self._currentVideo.progress.speed = d.get('speed')
                 self._currentVideo.progress.elapsed = d.get('elapsed')
                 videoObject = self._currentVideo.toObject()
+                model.video.touch()
             
             logger.debug('---------- progress_hook called threadId=' + str(threading.get_native_id()) + ', progress=' + ("{:.4f}".format(progress)) + ', ' + str(d.get('downloaded_bytes')) + '/' + str(totalBytes) + ', status=' + d['status'] + ', filename=' + d['filename'] + ', weight=' + str(weight) + ', previousWeight=' + str(previousWeight) + ', speed=' + str(d.get('speed')))
             # n updates per second
@@ -110,16 +110,18 @@ class DownloaderThread:
                 'namespace': 'videos',
                 'video': videoObject,
                 'source': 'progressHook',
-            })
+            }, key='progress:' + str(videoObject['id'])) # only the newest progress for a video is kept for slow clients
 
     def _download(self):
         # this will keep the thread busy until the video is downloaded
+        import yt_dlp
         with self._mutex:
             # remove top item from queue
             self._currentVideo = self._queue.pop(0)
 
         with model.video.dataMutex():
             self._currentVideo.progress = model.VideoProgress()
+            model.video.touch()
             self._previousWeight = 0
             url = self._currentVideo.url
             logger.info('Downloading next item from queue ' + str(self._currentVideo.videoId))
@@ -312,6 +314,7 @@ class DownloaderThread:
                 'namespace': 'videos',
                 'video': self._currentVideo.toObject()
             })
+        model.video.flush() # completed status must survive a power cut
 
         # download is done
         with self._mutex:
@@ -332,6 +335,18 @@ class DownloaderThread:
             if (video in self._queue):
                 self._queue.remove(video)
 
+    def stats(self):
+        """
+        Download queue length and progress (0-100) of the current download, see metrics.collect()
+        """
+        with self._mutex:
+            queued = len(self._queue)
+        progress = 0
+        current = self._currentVideo
+        if (current != None and current.progress != None):
+            progress = current.progress.progress
+        return queued, progress
+
     def close(self):
         self._running = False
 
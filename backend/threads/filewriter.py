@@ -0,0 +1,125 @@
+"""
+ * Developed by Hutz Media Ltd. <info@hutzmedia.com>
+ * Copyright 2026-10-18
+ * See README.md
+"""
+
+import threading
+import time
+import os
+import asyncio
+from collections import deque
+
+import logging
+logger = logging.getLogger('piworkout-server')
+
+# bytes waiting to be written before the uploading client stops being read, see writable()
+MAX_PENDING = int(os.getenv('FILE_WRITER_MAX_PENDING', str(32 * 1024 * 1024)))
+
+class FileWriterThread:
+    """
+    Write upload chunks to disk off the event loop. Jobs run in the order they are submitted.
+    """
+    _running = True
+
+    def __init__(self):
+        self._jobs = deque() # (fn, args, size)
+        self._periodic = [] # [interval, next run, fn], see every()
+        self._condition = threading.Condition()
+        self.pending = 0 # bytes submitted but not yet written
+        self.written = 0 # bytes written
+        self.writeSeconds = 0.0 # time spent writing
+        self.stalls = 0 # number of times a client had to wait for the disk
+        self.stallSeconds = 0.0 # time clients spent waiting for the disk
+
+    def run(self):
+        while True:
+            with self._condition:
+                timeout = self._schedule()
+                while (len(self._jobs) == 0 and self._running):
+                    self._condition.wait(timeout)
+                    timeout = self._schedule()
+                if (len(self._jobs) == 0):
+                    # closed and everything has been written
+                    return None
+                fn, args, size = self._jobs.popleft()
+            start = time.perf_counter()
+            try:
+                fn(*args)
+            except Exception as e:
+                logger.error('File writer error: ' + str(e))
+            finally:
+                elapsed = time.perf_counter() - start
+                with self._condition:
+                    self.pending -= size
+                    if (size > 0):
+                        self.written += size
+                        self.writeSeconds += elapsed
+
+    def close(self):
+        with self._condition:
+            self._running = False
+            self._condition.notify()
+
+    def _schedule(self):
+        # queue periodic jobs that are due, returns seconds until the next one (None waits for submit())
+        now = time.time()
+        timeout = None
+        for item in self._periodic:
+            interval, due, fn = item
+            if (now >= due):
+                self._jobs.append((fn, (), 0))
+                due = now + interval
+                item[1] = due
+            timeout = (due - now) if (timeout == None) else min(timeout, due - now)
+        return timeout
+
+    def every(self, interval: float, fn):
+        """
+        Run fn() on the writer thread every interval seconds, never at the same time as a chunk write
+        """
+        with self._condition:
+            self._periodic.append([interval, time.time() + interval, fn])
+            self._condition.notify()
+
+    def submit(self, fn, *args, size: int = 0):
+        """
+        Run fn(*args) on the writer thread. size is the number of bytes the job writes.
+        """
+        with self._condition:
+            self._jobs.append((fn, args, size))
+            self.pending += size
+            self._condition.notify()
+
+THREAD = FileWriterThread()
+
+def submit(fn, *args, size: int = 0):
+    THREAD.submit(fn, *args, size=size)
+
+def every(interval: float, fn):
+    THREAD.every(interval, fn)
+
+async def writable():
+    """
+    Wait until the writer has room for more data. Called by the websocket reader after an upload chunk,
+    while it waits no more chunks are read from the client and TCP backpressure slows the upload down.
+    """
+    if (THREAD.pending <= MAX_PENDING):
+        return None
+    start = time.perf_counter()
+    while (THREAD.pending > MAX_PENDING):
+        await asyncio.sleep(0.01)
+    THREAD.stalls += 1
+    THREAD.stallSeconds += time.perf_counter() - start
+
+def _runThread():
+    THREAD.run()
+
+def run():
+    logger.debug('filewriter run()')
+    t = threading.Thread(target=_runThread)
+    t.start()
+
+def close():
+    logger.debug('filewriter close()')
+    THREAD.close()
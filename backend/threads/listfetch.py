@@ -14,9 +14,6 @@ import urllib.error
 import urllib.parse
 import random
 import json
-from google.auth.exceptions import RefreshError
-from google.api_core.exceptions import RetryError, ServiceUnavailable, NotFound
-import yt_dlp
 import subprocess
 import traceback
 
@@ -28,11 +25,16 @@ class ListFetchThread:
     _shouldFetch = True
     _gcCounter = 60
     _wait = 60 # check every 60 seconds
+    lastFetchDuration = 0 # seconds taken by the last successful fetch
     markWatchedQueue = []
     queueMutex = threading.Lock()
     cj = None
 
     def run(self):
+        # imported here so loading google libraries does not delay startup
+        from google.auth.exceptions import RefreshError
+        from google.api_core.exceptions import RetryError, ServiceUnavailable
+
         start = time.time()
         while (self._running):
             elapsed = time.time() - start
@@ -42,7 +44,9 @@ class ListFetchThread:
                 start = time.time() # reset timer
 
                 try:
+                    fetchStart = time.monotonic()
                     model.video.fetch()
+                    self.lastFetchDuration = time.monotonic() - fetchStart
                     self._gcCounter += 1
                     if (self._gcCounter >= 60):
                         self._gcCounter = 0
@@ -104,6 +108,7 @@ class ListFetchThread:
         }
 
         # download
+        import yt_dlp
         with yt_dlp.YoutubeDL(ydl_opts) as ydl:
             logger.info('------------------------------- starting simulated download')
             ydl.download(youtubeUrl)
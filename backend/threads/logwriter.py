@@ -0,0 +1,68 @@
+"""
+ * Developed by Hutz Media Ltd. <info@hutzmedia.com>
+ * Copyright 2026-10-18
+ * See README.md
+"""
+
+import threading
+import time
+import os
+import model
+
+import logging
+logger = logging.getLogger('piworkout-server')
+
+FLUSH_INTERVAL = float(os.getenv('LOG_FLUSH_INTERVAL', '2')) # seconds between writes of queued log entries
+MAINTENANCE_INTERVAL = int(os.getenv('LOG_MAINTENANCE_INTERVAL', str(6 * 60 * 60))) # seconds between log pruning and database compaction
+MAINTENANCE_DELAY = 5 * 60 # seconds after startup before the first maintenance, keeps it out of the startup rush
+
+class LogWriterThread:
+    """
+    Write queued log entries in batches, prune old logs and compact the database in the background
+    """
+    _running = True
+    lastMaintenanceDuration = 0 # seconds taken by the last maintenance
+
+    def __init__(self):
+        self._closed = threading.Event()
+        self._nextMaintenance = time.time() + MAINTENANCE_DELAY
+
+    def run(self):
+        while (self._running):
+            self._closed.wait(FLUSH_INTERVAL)
+            model.log.flush()
+            if (self._running and time.time() >= self._nextMaintenance):
+                self._maintenance()
+                self._nextMaintenance = time.time() + MAINTENANCE_INTERVAL
+
+    def close(self):
+        self._running = False
+        self._closed.set()
+
+    def _maintenance(self):
+        start = time.perf_counter()
+        try:
+            deleted = model.log.prune()
+            if (deleted == 0):
+                # retention is off or nothing was old enough, there are no pages to free
+                return None
+            freed = model.db.compact()
+        except Exception as e:
+            logger.error('Database maintenance failed: ' + str(e))
+            return None
+        self.lastMaintenanceDuration = time.perf_counter() - start
+        logger.info('Database maintenance deleted ' + str(deleted) + ' logs, freed ' + str(freed) + ' pages in ' + str(round(self.lastMaintenanceDuration * 1000)) + 'ms')
+
+THREAD = LogWriterThread()
+
+def _runThread():
+    THREAD.run()
+
+def run():
+    logger.debug('logwriter run()')
+    t = threading.Thread(target=_runThread)
+    t.start()
+
+def close():
+    logger.debug('logwriter close()')
+    THREAD.close()
@@ -9,7 +9,6 @@ import time
 import os
 import subprocess
 import struct
-import yt_dlp
 import json
 import requests
 import shutil
@@ -27,6 +26,7 @@ class SBGeneratorThread:
     queueMutex = threading.Lock()
 
     def run(self):
+        self._findMissing()
         while (self._running):
             video = None
             with self.queueMutex:
@@ -38,7 +38,23 @@ class SBGeneratorThread:
             
     def close(self):
         self._running = False
-        
+
+    def _findMissing(self):
+        """
+        Queue every video without a storyboard. Runs on this thread so startup does not wait for a stat of every video.
+        """
+        missing = []
+        for video in model.video.data():
+            if (not self._running):
+                return None
+            with model.video.dataMutex():
+                sbbPath = '/videos/' + str(video.id) + '-' + video.filename + '.sbb'
+            if (not os.path.exists(sbbPath)):
+                missing.append(video)
+        if (len(missing) > 0):
+            logger.debug('Found ' + str(len(missing)) + ' videos without storyboards.')
+            with self.queueMutex:
+                self.generateQueue.extend(missing)
         
     def _generateSB(self, video):
         with model.video.dataMutex():
@@ -68,6 +84,7 @@ class SBGeneratorThread:
             'format': 'sb0',
             #'cookiefile': './db/cookies.txt', # disabled cookies
         }
+        import yt_dlp
         with yt_dlp.YoutubeDL(ydl_opts) as ydl:
             logger.debug('getting information from ytdlp')
             info = ydl.extract_info(url, download = False)
@@ -0,0 +1,114 @@
+"""
+ * Developed by Hutz Media Ltd. <info@hutzmedia.com>
+ * Copyright 2026-10-18
+ * See README.md
+"""
+
+import threading
+import time
+import os
+import json
+import importlib.metadata
+
+import logging
+logger = logging.getLogger('piworkout-server')
+
+CACHE_FILE = './db/yt-dlp-latest.json'
+INTERVAL = int(os.getenv('YTDLP_VERSION_CHECK_INTERVAL', str(24 * 60 * 60))) # seconds between checks for the latest yt-dlp release
+RETRY = 10 * 60 # seconds before trying again when the check fails (e.g. network is down)
+
+def installedVersion():
+    """
+    Version of the installed yt-dlp package without importing yt_dlp
+    """
+    try:
+        return importlib.metadata.version('yt-dlp')
+    except importlib.metadata.PackageNotFoundError:
+        return 'unknown'
+
+class VersionCheckThread:
+    """
+    Look up the latest yt-dlp release in the background. The result is cached on disk so a restart
+    (or a restart without network) shows the last known value immediately.
+    """
+    _running = True
+    installed = installedVersion()
+    latest = None # latest release, None until known
+    checked = 0 # time of last successful check
+    _nextCheck = 0
+
+    def __init__(self):
+        self._load()
+
+    def run(self):
+        while (self._running):
+            if (time.time() >= self._nextCheck):
+                self._check()
+            # sleep in small steps so close() is not delayed
+            for i in range(60):
+                if (not self._running):
+                    break
+                time.sleep(1)
+
+    def close(self):
+        self._running = False
+
+    def versionString(self):
+        if (self.latest == None):
+            return self.installed
+        return self.installed + ' (latest=' + self.latest + ')'
+
+    def _check(self):
+        try:
+            import yt_dlp
+            with yt_dlp.YoutubeDL({'quiet': True}) as ydl:
+                latest = yt_dlp.Updater(ydl)._get_version_info('latest')[0]
+        except Exception as e:
+            logger.warning('Unable to check latest yt-dlp version: ' + str(e))
+            self._nextCheck = time.time() + RETRY
+            return None
+        if (latest == None):
+            self._nextCheck = time.time() + RETRY
+            return None
+        self.latest = latest
+        self.checked = time.time()
+        self._nextCheck = self.checked + INTERVAL
+        logger.info('yt-dlp installed=' + self.installed + ', latest=' + self.latest)
+        self._save()
+
+    def _load(self):
+        try:
+            with open(CACHE_FILE, 'r') as fp:
+                data = json.load(fp)
+            self.latest = data['latest']
+            self.checked = data['checked']
+            self._nextCheck = self.checked + INTERVAL
+        except (OSError, ValueError, KeyError):
+            pass
+
+    def _save(self):
+        try:
+            with open(CACHE_FILE, 'w') as fp:
+                json.dump({
+                    'latest': self.latest,
+                    'checked': self.checked,
+                }, fp)
+        except OSError as e:
+            logger.warning('Unable to write ' + CACHE_FILE + ': ' + str(e))
+
+THREAD = VersionCheckThread()
+
+def versionString():
+    return THREAD.versionString()
+
+def _runThread():
+    THREAD.run()
+
+def run():
+    logger.debug('versioncheck run()')
+    t = threading.Thread(target=_runThread)
+    t.start()
+
+def close():
+    logger.debug('versioncheck close()')
+    THREAD.close()